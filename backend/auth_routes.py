@@ -1,11 +1,55 @@
 
 from flask import request, make_response, jsonify
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
 import hashlib
 import secrets
+import os
 import re
 
 from config import userCollection
+from util.lru import TTLCache
+from util.metrics import metrics
+
+# hashed token -> {"_id", "username"} of the logged-in user; evicted on logout and re-login. Only the
+# worker that served the logout evicts it, so the TTL is kept short: it bounds how long a revoked token
+# still works in the other workers, while a burst of clicks still costs one lookup
+user_cache = TTLCache(int(os.environ.get("USER_CACHE_SIZE", 10000)), float(os.environ.get("USER_CACHE_TTL", 5)))
+
+# bcrypt releases the GIL; a bounded pool caps how many hashes use the CPU at once. The request thread
+# still waits for its own hash.
+password_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("BCRYPT_WORKERS", os.cpu_count() or 2)), thread_name_prefix="bcrypt")
+
+
+def hash_token(auth_token):
+    return hashlib.sha256(auth_token.encode("utf-8")).hexdigest()
+
+
+def get_user_from_token(auth_token):
+    """Identity ({"_id", "username"}) of the user owning a session token, or None."""
+    hashed_token = hash_token(auth_token)
+    user = user_cache.get(hashed_token)
+    metrics.count("cache_requests_total", cache="user", result="miss" if user is None else "hit")
+    if user is None:
+        user = userCollection.find_one({"token": hashed_token}, {"_id": 1, "username": 1})
+        if user is None:
+            return None
+        user_cache.set(hashed_token, user)
+    return user
+
+
+def forget_token(hashed_token):
+    if hashed_token:
+        user_cache.pop(hashed_token)
+
+
+def hash_password(password):
+    salt = bcrypt.gensalt()
+    return password_pool.submit(bcrypt.hashpw, password.encode('utf-8'), salt).result(), salt
+
+
+def check_password(password, hashed_password):
+    return password_pool.submit(bcrypt.checkpw, password.encode('utf-8'), hashed_password).result()
 
 
 def is_valid_email(email):
@@ -29,21 +73,20 @@ def register():
         if not is_valid_email(email):
             return jsonify({"message_email": "Invalid email format."}), 400
 
-        findDupName = userCollection.find_one({"username": username})
-        findDupEmail = userCollection.find_one({"email": email})
-        
-        if findDupEmail:
+        # One query for both duplicate checks
+        duplicates = list(userCollection.find({"$or": [{"username": username}, {"email": email}]}, {"username": 1, "email": 1}))
+
+        if any(user.get("email") == email for user in duplicates):
             return jsonify({"message_email": "Email already in use. Please choose another one."}), 400
         
-        if findDupName: 
+        if any(user.get("username") == username for user in duplicates):
             return jsonify({"message_username": "Username already exist. Please try another name."}), 400
         
         if password != passwordConfirm:
             return jsonify({"message_password": "Passwords do not match."}), 400
         
         
-        salt = bcrypt.gensalt()
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
+        hashed_password, salt = hash_password(password)
 
         userCollection.insert_one({
             "email": email,
@@ -68,16 +111,16 @@ def login():
         if not username or not userPassword:
             return jsonify({'message_required': 'Username and password are required.'}), 400
 
-        userRecord = userCollection.find_one({"username": username})
+        userRecord = userCollection.find_one({"username": username}, {"password": 1, "token": 1})
 
         if userRecord:
-            salt = userRecord["salt"]
-            hashedPassword = bcrypt.hashpw(userPassword.encode(), salt)
+            if check_password(userPassword, userRecord["password"]):
+                # The previous session token stops working, so drop it from the cache too
+                forget_token(userRecord.get("token"))
 
-            if hashedPassword == userRecord["password"]:
                 # Generate auth token and hashed token for database storage
                 token = secrets.token_hex()
-                hashedToken = hashlib.sha256(token.encode("utf-8")).hexdigest()
+                hashedToken = hash_token(token)
 
                 # Set the auth token as a secure, HttpOnly cookie
                 response = make_response(jsonify({'message': 'Login successful'}))
@@ -97,4 +140,14 @@ def login():
     except Exception as e: 
         return jsonify({'message': 'An error occurred'}), 500
 
+def logout():
+    auth_token = request.cookies.get('authToken')
+    if auth_token:
+        hashed_token = hash_token(auth_token)
+        forget_token(hashed_token)
+        userCollection.update_one({"token": hashed_token}, {"$unset": {"token": ""}})
+    response = make_response(jsonify({"message": "Logged out successfully"}))
+    response.set_cookie('authToken', '', expires=0)
+    return response
+
     
\ No newline at end of file
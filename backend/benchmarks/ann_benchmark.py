@@ -0,0 +1,75 @@
+#Recall@k and queries/sec of the IVF index against exact search, at several catalog sizes
+#Run from backend/:  python -m benchmarks.ann_benchmark --sizes 10000 100000 1000000
+import argparse
+import json
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from util.ann import IVFIndex
+from util.similarity import SimilarityEngine
+
+
+#Clustered sparse rows shaped like processData output: a topic picks most of each row's features
+def synthetic_factors(n, n_features=5000, nnz_per_row=40, n_topics=200, seed=0):
+    rng = np.random.default_rng(seed)
+    topic_vocab = rng.integers(0, n_features, size=(n_topics, nnz_per_row * 2))
+    topics = rng.integers(0, n_topics, size=n)
+    from_topic = topic_vocab[topics[:, None], rng.integers(0, nnz_per_row * 2, size=(n, nnz_per_row))]
+    noise = rng.integers(0, n_features, size=(n, nnz_per_row // 4))
+    cols = np.concatenate([from_topic, noise], axis=1)
+    rows = np.repeat(np.arange(n), cols.shape[1])
+    values = rng.random(cols.size, dtype=np.float32)
+    factors = sp.csr_matrix((values, (rows, cols.ravel())), shape=(n, n_features), dtype=np.float32)
+    factors.sum_duplicates()
+    return factors
+
+
+def timed_queries(engine, seeds, k, **kwargs):
+    start = time.perf_counter()
+    results = [engine.query(int(idx), k, **kwargs)[0] for idx in seeds]
+    return results, len(seeds) / (time.perf_counter() - start)
+
+
+def run(sizes, probes, k, n_queries):
+    report = []
+    for n in sizes:
+        factors = synthetic_factors(n)
+        exact = SimilarityEngine(factors)
+        start = time.perf_counter()
+        ivf = IVFIndex(factors)
+        build_seconds = time.perf_counter() - start
+
+        seeds = np.random.default_rng(1).choice(n, min(n_queries, n), replace=False)
+        truth, exact_qps = timed_queries(exact, seeds, k)
+        for n_probe in probes:
+            found, ivf_qps = timed_queries(ivf, seeds, k, n_probe=n_probe)
+            recall = np.mean([len(np.intersect1d(a, b)) / len(a) for a, b in zip(truth, found)])
+            row = {
+                "catalog_size": n,
+                "n_lists": ivf.n_lists,
+                "n_probe": n_probe,
+                f"recall@{k}": round(float(recall), 4),
+                "exact_qps": round(exact_qps, 1),
+                "ivf_qps": round(ivf_qps, 1),
+                "ivf_build_seconds": round(build_seconds, 2),
+            }
+            print(json.dumps(row))
+            report.append(row)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IVF vs exact similarity benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 200000])
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--output", help="optional path for the JSON report")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.probes, args.k, args.queries)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,62 @@
+#Throughput of /api/like and /api/dislike with the authenticated-user cache disabled vs enabled
+#Run from backend/ (with Data/movies_metadata.csv present):  python -m benchmarks.auth_benchmark --mongomock
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+import argparse
+import json
+import secrets
+import time
+
+
+def run(requests_per_thread, threads, users):
+    import server
+    import auth_routes
+    from config import userCollection
+
+    model = server.recommender.get_model()
+    hydrator = server.get_hydrator(model)
+    #Movies missing from an empty stand-in database still exercise the full write path
+    movie_ids = [str(i) for i in hydrator.row_ids[:200] if i is not None] or [str(ObjectId()) for _ in range(200)]
+    tokens = []
+    for n in range(users):
+        token = secrets.token_hex()
+        userCollection.insert_one({"username": f"bench{n}", "token": auth_routes.hash_token(token), "likes": [], "dislikes": []})
+        tokens.append(token)
+
+    def client_loop(worker):
+        client = server.app.test_client()
+        client.set_cookie("authToken", tokens[worker % len(tokens)])
+        for i in range(requests_per_thread):
+            route = "/api/like" if i % 2 == 0 else "/api/dislike"
+            response = client.post(route, json={"movieId": movie_ids[(worker + i) % len(movie_ids)]})
+            assert response.status_code == 200, response.get_json()
+
+    def timed():
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(client_loop, range(threads)))
+        return round(requests_per_thread * threads / (time.perf_counter() - start), 1)
+
+    report = {"threads": threads, "requests": requests_per_thread * threads}
+    cache_size = auth_routes.user_cache.max_size
+    #max_size 0 evicts every entry immediately: the token lookup hits Mongo on every request
+    auth_routes.user_cache.max_size = 0
+    report["uncached_req_per_sec"] = timed()
+    auth_routes.user_cache.max_size = cache_size
+    report["cached_req_per_sec"] = timed()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="like/dislike throughput with and without the user cache")
+    parser.add_argument("--requests", type=int, default=500, help="requests per thread")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--users", type=int, default=1000, help="user documents in the collection")
+    parser.add_argument("--mongomock", action="store_true", help="use an in-memory Mongo stand-in")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    print(json.dumps(run(args.requests, args.threads, args.users), indent=2))
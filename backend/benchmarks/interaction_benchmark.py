@@ -0,0 +1,122 @@
+#Throughput of /api/like and /api/dislike with one Mongo write per click (the previous behaviour) vs the
+#write-behind interaction queue, over a user collection with a simulated network round trip per call
+#Run from backend/ (with Data/movies_metadata.csv present):  python -m benchmarks.interaction_benchmark --mongomock
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+
+
+#A collection whose writes cost one round trip each, counted
+class RemoteCollection:
+    def __init__(self, collection, round_trip):
+        self.collection = collection
+        self.round_trip = round_trip
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def call(self, method, *args, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.round_trip)
+        return getattr(self.collection, method)(*args, **kwargs)
+
+    def update_one(self, *args, **kwargs):
+        return self.call("update_one", *args, **kwargs)
+
+    def bulk_write(self, *args, **kwargs):
+        return self.call("bulk_write", *args, **kwargs)
+
+
+#What the routes did before the queue: one update_one per click, nothing pending
+class PerClickWrites:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def submit(self, user_id, events):
+        for movie_id, value in events:
+            liked, disliked = ("likes", "dislikes") if value == 1 else ("dislikes", "likes")
+            self.collection.update_one({"_id": user_id}, {"$addToSet": {liked: movie_id}, "$pull": {disliked: movie_id}})
+
+    def pending(self, user_id):
+        return {}
+
+
+def run(requests_per_thread, threads, movies, round_trip):
+    import server
+    import auth_routes
+    from config import userCollection
+    from util.interactions import InteractionQueue
+
+    #each thread is one user clicking through a small set of movies, so later clicks overwrite earlier ones
+    movie_ids = [str(ObjectId()) for _ in range(movies)]
+    rng = random.Random(0)
+    clicks = [[(rng.choice(movie_ids), rng.choice(["/api/like", "/api/dislike"])) for _ in range(requests_per_thread)] for _ in range(threads)]
+
+    def add_users():
+        tokens = []
+        for n in range(threads):
+            token = secrets.token_hex()
+            userCollection.insert_one({"username": f"bench{n}-{token[:8]}", "token": auth_routes.hash_token(token), "likes": [], "dislikes": []})
+            tokens.append(token)
+        return tokens
+
+    def timed(tokens):
+        def client_loop(worker):
+            client = server.app.test_client()
+            client.set_cookie("authToken", tokens[worker])
+            for movie_id, route in clicks[worker]:
+                response = client.post(route, json={"movieId": movie_id})
+                assert response.status_code == 200, response.get_json()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(client_loop, range(threads)))
+        return time.perf_counter() - start
+
+    def final_ratings(tokens):
+        users = [userCollection.find_one({"token": auth_routes.hash_token(token)}) for token in tokens]
+        return [(sorted(map(str, user["likes"])), sorted(map(str, user["dislikes"]))) for user in users]
+
+    report = {"threads": threads, "requests": requests_per_thread * threads, "movies_per_user": movies, "round_trip_ms": round_trip * 1000}
+    queue = server.interactions
+
+    remote = RemoteCollection(userCollection, round_trip)
+    server.interactions = PerClickWrites(remote)
+    tokens = add_users()
+    seconds = timed(tokens)
+    report["per_click"] = {"req_per_sec": round(report["requests"] / seconds, 1), "mongo_writes": remote.calls}
+    expected = final_ratings(tokens)
+
+    remote = RemoteCollection(userCollection, round_trip)
+    server.interactions = InteractionQueue(remote, max_pending=queue.max_pending, flush_interval=queue.flush_interval, submit_timeout=queue.submit_timeout)
+    tokens = add_users()
+    seconds = timed(tokens)
+    start = time.perf_counter()
+    server.interactions.close()
+    report["write_behind"] = {"req_per_sec": round(report["requests"] / seconds, 1), "mongo_writes": remote.calls,
+                              "shutdown_flush_ms": round((time.perf_counter() - start) * 1000, 1), **server.interactions.stats}
+    #last writer wins per movie, so both paths must leave the same likes and dislikes behind
+    report["same_final_ratings"] = final_ratings(tokens) == expected
+    server.interactions = queue
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="like/dislike throughput with per-click writes vs the write-behind queue")
+    parser.add_argument("--requests", type=int, default=500, help="requests per thread (one user per thread)")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--movies", type=int, default=50, help="distinct movies each user clicks on")
+    parser.add_argument("--round-trip-ms", type=float, default=1.0, help="simulated Mongo round trip per write")
+    parser.add_argument("--mongomock", action="store_true", help="use an in-memory Mongo stand-in")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    print(json.dumps(run(args.requests, args.threads, args.movies, args.round_trip_ms / 1000), indent=2))
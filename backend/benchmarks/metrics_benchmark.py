@@ -0,0 +1,85 @@
+#Overhead of the hot-path instrumentation: recommendation latency with metrics off, on, and on with a
+#Server-Timing trace, plus the raw cost of one span and one counter increment
+#Run from backend/:  python -m benchmarks.metrics_benchmark --rows 20000 --queries 500
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_catalog
+from util import csvParser, recommender
+from util.metrics import metrics, start_trace, stop_trace
+
+
+def per_call_ns(fn, n=100000):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return round((time.perf_counter() - start) / n * 1e9, 1)
+
+
+def empty_span():
+    with metrics.span("benchmark"):
+        pass
+
+
+def run(rows, n_queries, rounds):
+    os.chdir(tempfile.mkdtemp(prefix="metricsbench-"))
+    generate_catalog(csvParser.CSV_FILE_PATH, rows)
+    #Every query has to run the full path, not come back from the result cache
+    recommender.RESULT_CACHE_SIZE = 0
+    model = recommender.initdata()
+    rng = np.random.default_rng(0)
+    titles = list(model.data.titles.take(rng.integers(0, len(model.data), n_queries)))
+
+    def median_ms(enabled, trace):
+        metrics.enabled = enabled
+        durations = []
+        for title in titles:
+            if trace:
+                start_trace()
+            start = time.perf_counter()
+            recommender.MakeRecommendationRows(model, title)
+            durations.append(time.perf_counter() - start)
+            stop_trace()
+        return float(np.median(durations)) * 1000
+
+    modes = {"off": (False, False), "on": (True, False), "on_with_trace": (True, True)}
+    #Interleave the modes so drift (caches, CPU frequency) does not favour one of them
+    samples = {mode: [] for mode in modes}
+    for _ in range(rounds):
+        for mode, (enabled, trace) in modes.items():
+            samples[mode].append(median_ms(enabled, trace))
+    best = {mode: min(values) for mode, values in samples.items()}
+
+    metrics.enabled = True
+    trace = start_trace()
+    recommender.MakeRecommendationRows(model, titles[0])
+    stop_trace()
+    report = {
+        "rows": rows,
+        "queries": n_queries,
+        "median_ms": {mode: round(value, 4) for mode, value in best.items()},
+        "overhead_pct": {mode: round((best[mode] / best["off"] - 1) * 100, 2) for mode in ("on", "on_with_trace")},
+        "span_ns": per_call_ns(empty_span),
+        "count_ns": per_call_ns(lambda: metrics.count("benchmark_total", kind="x")),
+    }
+    #Medians differ by less than run-to-run noise, so also estimate the overhead from the span cost
+    report["spans_per_query"] = len(trace)
+    report["estimated_overhead_pct"] = round(len(trace) * report["span_ns"] / 1e6 / best["off"] * 100, 3)
+    metrics.enabled = False
+    report["disabled_span_ns"] = per_call_ns(empty_span)
+    metrics.enabled = True
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Instrumentation overhead benchmark")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.queries, args.rounds), indent=2))
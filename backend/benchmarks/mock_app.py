@@ -0,0 +1,7 @@
+#WSGI entry point for benchmarks: the real app on an in-memory Mongo stand-in (mongomock)
+import mongomock
+import pymongo
+
+pymongo.MongoClient = mongomock.MongoClient
+
+from server import app  # noqa: E402
@@ -0,0 +1,81 @@
+#Poster resolution latency and hit rates against a local stub standing in for TMDB
+#Run from backend/:  python -m benchmarks.poster_benchmark --latency 0.05 --ids 50
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import threading
+import time
+
+import requests
+
+from util.posters import PosterResolver
+
+
+def stub_tmdb(latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            imdb_id = self.path.split("?")[0].rstrip("/").split("/")[-1]
+            #every fifth id has no poster, to exercise negative caching
+            results = [] if int(imdb_id[2:]) % 5 == 0 else [{"poster_path": f"/{imdb_id}.jpg"}]
+            body = json.dumps({"movie_results": results}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/3"
+
+
+#The previous behaviour: one fresh, un-pooled request per id, one after another
+def serial_uncached(api_base, imdb_ids):
+    for imdb_id in imdb_ids:
+        requests.get(f"{api_base}/find/{imdb_id}", params={"api_key": "stub", "external_source": "imdb_id"}, timeout=5).json()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def run(latency, n_ids, collection=None):
+    server, api_base = stub_tmdb(latency)
+    imdb_ids = [f"tt{i:07d}" for i in range(n_ids)]
+    resolver = PosterResolver("stub", collection, api_base=api_base)
+
+    report = {
+        "stub_latency_ms": latency * 1000,
+        "ids": n_ids,
+        "serial_uncached_ms": timed(serial_uncached, api_base, imdb_ids),
+        "cold_ms": timed(resolver.resolve_many, imdb_ids),
+        "warm_ms": timed(resolver.resolve_many, imdb_ids),
+    }
+    if collection is not None:
+        #A fresh process: empty memory, populated persistent cache
+        report["restart_ms"] = timed(PosterResolver("stub", collection, api_base=api_base).resolve_many, imdb_ids)
+    lookups = 2 * n_ids
+    report["memory_hit_rate"] = round(resolver.stats["memory_hits"] / lookups, 3)
+    report["stats"] = resolver.stats
+    server.shutdown()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TMDB poster cache benchmark")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub response delay in seconds")
+    parser.add_argument("--ids", type=int, default=50)
+    parser.add_argument("--mongomock", action="store_true", help="also exercise the persistent cache with mongomock")
+    args = parser.parse_args()
+
+    collection = None
+    if args.mongomock:
+        import mongomock
+        collection = mongomock.MongoClient().db.poster_cache
+    print(json.dumps(run(args.latency, args.ids, collection), indent=2))
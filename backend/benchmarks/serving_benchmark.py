@@ -0,0 +1,101 @@
+#Per-worker memory (RSS and PSS, i.e. RSS with shared pages split between sharers) and aggregate
+#throughput of the gunicorn production mode as the worker count grows.
+#Run from the directory holding Data/ and models/:
+#  python -m benchmarks.serving_benchmark --workers 1 2 4 --mongomock
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_kb(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1].lower() + "_mb"] = round(int(parts[1]) / 1024, 1)
+    return values
+
+
+def worker_pids(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def start_server(n_workers, port, app):
+    command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+               "--pythonpath", BACKEND_DIR, "--workers", str(n_workers), "--bind", f"127.0.0.1:{port}",
+               "--access-logfile", "/dev/null", app]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 600
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            if len(worker_pids(process.pid)) == n_workers:
+                return process
+        except (requests.ConnectionError, FileNotFoundError):
+            pass
+        time.sleep(0.5)
+    process.kill()
+    raise RuntimeError("gunicorn did not come up")
+
+
+def load(port, titles, clients, seconds):
+    url = f"http://127.0.0.1:{port}/api/MakeRecommendation"
+    deadline = time.time() + seconds
+
+    def client_loop(worker):
+        session = requests.Session()
+        done = 0
+        while time.time() < deadline:
+            session.post(url, json={"movieTitle": titles[(worker * 7919 + done) % len(titles)]}).raise_for_status()
+            done += 1
+        return done
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        total = sum(pool.map(client_loop, range(clients)))
+    return round(total / (time.time() - start), 1)
+
+
+def run(worker_counts, clients, seconds, app, port):
+    titles = pd.read_csv("Data/movies_metadata.csv", usecols=["title"], low_memory=False)["title"].dropna().tolist()[:2000]
+    report = []
+    for n_workers in worker_counts:
+        process = start_server(n_workers, port, app)
+        try:
+            throughput = load(port, titles, clients, seconds)
+            row = {
+                "workers": n_workers,
+                "req_per_sec": throughput,
+                "master": memory_kb(process.pid),
+                "per_worker": [memory_kb(pid) for pid in worker_pids(process.pid)],
+            }
+            row["total_pss_mb"] = round(row["master"]["pss_mb"] + sum(w["pss_mb"] for w in row["per_worker"]), 1)
+            print(json.dumps(row))
+            report.append(row)
+        finally:
+            process.terminate()
+            process.wait()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="gunicorn worker scaling benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16, help="concurrent HTTP clients")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--mongomock", action="store_true", help="serve benchmarks.mock_app instead of server:app")
+    args = parser.parse_args()
+
+    run(args.workers, args.clients, args.seconds, "benchmarks.mock_app:app" if args.mongomock else "server:app", args.port)
@@ -0,0 +1,206 @@
+#End-to-end cost of the model pipeline on synthetic catalogs: CSV parse, factor build, bundle size on
+#disk and in memory, and latency percentiles / QPS of the recommendation path, both in-process and
+#over HTTP against mongomock and a stub TMDB. Every size runs in a fresh process so memory figures
+#do not leak between sizes. Results are JSON, so runs on different commits can be diffed.
+#Run from backend/:  python -m benchmarks.suite --sizes 10000 100000 1000000 --output bench.json
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - start, 3)
+
+
+#Latency percentiles (ms) and queries/sec of calling fn once per argument
+def latency(fn, arguments):
+    durations = []
+    for argument in arguments:
+        start = time.perf_counter()
+        fn(argument)
+        durations.append(time.perf_counter() - start)
+    durations = np.array(durations) * 1000
+    return {
+        "queries": len(durations),
+        "p50_ms": round(float(np.percentile(durations, 50)), 3),
+        "p95_ms": round(float(np.percentile(durations, 95)), 3),
+        "p99_ms": round(float(np.percentile(durations, 99)), 3),
+        "qps": round(len(durations) / (durations.sum() / 1000), 1),
+    }
+
+
+def csr_bytes(matrix):
+    return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def max_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+#The web routes on mongomock: documents are inserted directly (upserts into mongomock are quadratic),
+#posters come from the stub TMDB, the model is the bundle built by the in-process stage
+def http_path(csv_path, titles, stub_latency):
+    import mongomock
+    import pandas as pd
+    import pymongo
+    from benchmarks.poster_benchmark import stub_tmdb
+    from initdb import chunk_to_documents
+
+    stub, api_base = stub_tmdb(stub_latency)
+    os.environ.setdefault("TMDB_API_KEY", "stub")
+    os.environ["TMDB_API_BASE"] = api_base
+    #no background warm-up competing with the measured requests
+    os.environ["RESULT_WARMUP_ON_START"] = "0"
+    pymongo.MongoClient = mongomock.MongoClient
+    import config
+    for chunk in pd.read_csv(csv_path, chunksize=5000, dtype={"id": str, "imdb_id": str}, low_memory=False):
+        config.movieCollection.insert_many(chunk_to_documents(chunk))
+
+    (_, import_seconds) = timed(__import__, "server")
+    client = sys.modules["server"].app.test_client()
+    errors = {"recommend": 0, "search": 0}
+
+    def recommend(title):
+        if client.post("/api/MakeRecommendation", json={"movieTitle": title}).status_code != 200:
+            errors["recommend"] += 1
+
+    def search(title):
+        if client.get("/search/title", query_string={"q": title}).status_code != 200:
+            errors["search"] += 1
+
+    report = {
+        "server_start_s": import_seconds,
+        #first pass resolves posters from the stub TMDB, the second one hits the poster and result caches
+        "recommend_cold": latency(recommend, titles),
+        "recommend_warm": latency(recommend, titles),
+        "search": latency(search, titles),
+        "errors": errors,
+    }
+    stub.shutdown()
+    return report
+
+
+#One catalog size, measured inside the current process (run from an empty working directory)
+def run_single(rows, n_queries, score_sample, http_max_rows, stub_latency, seed):
+    from benchmarks.synthetic import generate_catalog
+    from util import bundle, csvParser, recommender, search
+    from util.catalog import Catalog
+
+    csv_path = os.path.abspath(csvParser.CSV_FILE_PATH)
+    report = {"rows": rows}
+    _, report["generate_s"] = timed(generate_catalog, csv_path, rows, seed)
+    report["csv_mb"] = round(os.path.getsize(csv_path) / 2**20, 1)
+
+    data, report["parse_s"] = timed(csvParser.ParseMovieData, csv_path)
+    (movie_factors, vocabulary), report["factors_s"] = timed(recommender.buildFactors, data)
+    version = bundle.bundle_version(csv_path, csvParser.PARSER_VERSION, recommender.MAX_FEATURES)
+    _, report["save_s"] = timed(bundle.save, version, Catalog.from_frame(data), movie_factors, vocabulary, csv=csv_path,
+                                parser_version=csvParser.PARSER_VERSION, max_features=recommender.MAX_FEATURES)
+    del data, movie_factors
+    model, report["load_s"] = timed(recommender.load_model, version)
+    recommender.activate_model(model)
+
+    report["model"] = {
+        "backend": recommender.SIMILARITY_BACKEND,
+        "features": int(model.factors.shape[1]),
+        "nnz": int(model.factors.nnz),
+        "disk_mb": round(directory_bytes(bundle.bundle_path(version)) / 2**20, 1),
+        "factors_mb": round(csr_bytes(model.factors) / 2**20, 1),
+        "catalog_mb": round(model.data.nbytes() / 2**20, 1),
+        "max_rss_mb": max_rss_mb(),
+    }
+
+    rng = np.random.default_rng(seed)
+    titles = list(model.data.titles.take(rng.integers(0, len(model.data), n_queries)))
+    results = recommender.result_cache(model)
+    report["recommend"] = latency(lambda title: recommender.MakeRecommendationRows(model, title), titles)
+    #same titles again, now answered from the result cache
+    report["recommend_cached"] = latency(lambda title: recommender.MakeRecommendationRows(model, title), titles)
+    report["result_cache"] = results.stats()
+    results.clear()
+    _, report["batch_recommend_s"] = timed(recommender.MakeBatchRecommendationRows, model, titles)
+    results.clear()
+    _, report["warm_results_s"] = timed(recommender.warm_results, model)
+    #the rerank step alone, on candidate lists computed up front
+    candidates = [recommender.Recommender(model.titles.find(title)[0], model, 10) for title in titles]
+    report["rerank"] = latency(lambda candidate: recommender.TopRecommendationRows(model.data, *candidate, 5), candidates)
+    index, report["title_search_build_s"] = timed(search.TitleSearch, model)
+    report["title_search"] = {
+        "prefix": latency(lambda title: index.search(title[:max(1, len(title) // 2)]), titles),
+        "typo": latency(lambda title: index.search(title[:3] + title[4:]), titles),
+    }
+    _, seconds = timed(recommender.GetScore, model, [min(score_sample, rows)])
+    report["get_score"] = {"sample": min(score_sample, rows), "seconds": seconds}
+
+    if rows <= http_max_rows:
+        report["http"] = http_path(csv_path, titles[:min(n_queries, 200)], stub_latency)
+    report["max_rss_mb"] = max_rss_mb()
+    return report
+
+
+def run(sizes, n_queries, score_sample, http_max_rows, stub_latency, seed, keep):
+    report = {
+        "git_commit": subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": [],
+    }
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+    for rows in sizes:
+        workdir = tempfile.mkdtemp(prefix=f"moviebench-{rows}-")
+        env["MODEL_DIR"] = os.path.join(workdir, "models")
+        command = [sys.executable, "-m", "benchmarks.suite", "--single", str(rows), "--queries", str(n_queries),
+                   "--score-sample", str(score_sample), "--http-max-rows", str(http_max_rows),
+                   "--stub-latency", str(stub_latency), "--seed", str(seed)]
+        try:
+            output = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+        finally:
+            if not keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+        result = json.loads(output.strip().splitlines()[-1])
+        print(json.dumps(result), file=sys.stderr)
+        report["results"].append(result)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model pipeline benchmark on synthetic catalogs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=500, help="recommendation queries per size")
+    parser.add_argument("--score-sample", type=int, default=200, help="seed movies for the GetScore timing")
+    parser.add_argument("--http-max-rows", type=int, default=20000, help="skip the mongomock HTTP stage above this size")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="stub TMDB response delay in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the generated CSVs and bundles")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.single, args.queries, args.score_sample, args.http_max_rows, args.stub_latency, args.seed)))
+        sys.exit()
+
+    report = run(args.sizes, args.queries, args.score_sample, args.http_max_rows, args.stub_latency, args.seed, args.keep)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
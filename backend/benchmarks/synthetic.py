@@ -0,0 +1,89 @@
+#Synthetic movies_metadata.csv files with the same columns and value formats as the real dataset
+#Run from backend/:  python -m benchmarks.synthetic Data/movies_metadata.csv --rows 100000
+import argparse
+import csv
+import os
+
+import numpy as np
+
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama", "Family",
+          "Fantasy", "History", "Horror", "Music", "Mystery", "Romance", "Science Fiction",
+          "TV Movie", "Thriller", "War", "Western", "Foreign"]
+COLUMNS = ["adult", "belongs_to_collection", "budget", "genres", "homepage", "id", "imdb_id",
+           "original_language", "original_title", "overview", "popularity", "poster_path",
+           "production_companies", "production_countries", "release_date", "revenue", "runtime",
+           "spoken_languages", "status", "tagline", "title", "video", "vote_average", "vote_count"]
+
+
+#Zipf-distributed vocabulary so overview text has a realistic long tail
+def vocabulary(rng, size):
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    return ["".join(rng.choice(letters, rng.integers(3, 10))) for _ in range(size)]
+
+
+def zipf_choice(rng, n, count, a=1.2):
+    return (rng.zipf(a, count) - 1) % n
+
+
+#Split one flat draw into per-row lists of the given lengths
+def split(values, counts):
+    return np.split(values, np.cumsum(counts)[:-1])
+
+
+def generate_catalog(path, rows, seed=0, chunk_size=10000):
+    rng = np.random.default_rng(seed)
+    words = np.array(vocabulary(rng, 20000), dtype=object)
+    companies = [f"{' '.join(w.title() for w in words[rng.integers(0, 2000, 2)])} Pictures" for _ in range(5000)]
+    titled = np.array([w.title() for w in words], dtype=object)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for start in range(0, rows, chunk_size):
+            n = min(chunk_size, rows - start)
+            genre_counts = rng.integers(0, 4, n)
+            company_counts = rng.integers(0, 4, n)
+            title_counts = rng.integers(1, 5, n)
+            overview_counts = rng.integers(20, 80, n)
+            tagline_counts = rng.integers(0, 8, n)
+            genre_ids = split(np.argsort(rng.random((n, len(GENRES))), axis=1)[:, :3].ravel(), np.full(n, 3))
+            company_ids = split(zipf_choice(rng, len(companies), company_counts.sum()), company_counts)
+            title_words = split(zipf_choice(rng, len(words), title_counts.sum(), a=1.5), title_counts)
+            overview_words = split(zipf_choice(rng, len(words), overview_counts.sum()), overview_counts)
+            tagline_words = split(zipf_choice(rng, len(words), tagline_counts.sum()), tagline_counts)
+            years = rng.integers(1900, 2025, n)
+            months = rng.integers(1, 13, n)
+            days = rng.integers(1, 29, n)
+            popularity = rng.pareto(1.5, n)
+            vote_average = rng.uniform(0, 10, n)
+            budgets = rng.integers(0, 2e8, n)
+            revenues = rng.integers(0, 5e8, n)
+            runtimes = rng.integers(60, 200, n)
+            vote_counts = rng.integers(0, 10000, n)
+
+            for j in range(n):
+                i = start + j
+                title = " ".join(titled[title_words[j]])
+                writer.writerow([
+                    "False", "", budgets[j],
+                    str([{"id": int(g), "name": GENRES[g]} for g in genre_ids[j][:genre_counts[j]]]),
+                    "", i + 1, f"tt{i:07d}", "en", title, " ".join(words[overview_words[j]]),
+                    round(float(popularity[j]), 6), f"/{words[i % len(words)]}{i}.jpg",
+                    str([{"name": companies[c], "id": int(c)} for c in dict.fromkeys(company_ids[j].tolist())]),
+                    str([{"iso_3166_1": "US", "name": "United States of America"}]),
+                    f"{years[j]}-{months[j]:02d}-{days[j]:02d}",
+                    revenues[j], float(runtimes[j]),
+                    str([{"iso_639_1": "en", "name": "English"}]), "Released", " ".join(words[tagline_words[j]]),
+                    title, "False", round(float(vote_average[j]), 1), vote_counts[j],
+                ])
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic movies_metadata.csv")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=45000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_catalog(args.path, args.rows, args.seed)
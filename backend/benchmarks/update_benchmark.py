@@ -0,0 +1,58 @@
+#Cost of ingesting a batch of new movies through recommender.update_catalog, against rebuilding the
+#model (parse + refit + factor build) the way adding a movie used to require
+#Run from backend/:  python -m benchmarks.update_benchmark --rows 10000 100000 --batch 1000
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import generate_catalog
+from util import csvParser, recommender
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - start, 3)
+
+
+def run(sizes, batch):
+    report = []
+    for rows in sizes:
+        os.chdir(tempfile.mkdtemp(prefix="updatebench-"))
+        #The batch is the tail of a larger synthetic catalog, so it looks like the rest of it
+        generate_catalog("all.csv", rows + batch)
+        raw = pd.read_csv("all.csv", low_memory=False)
+        os.makedirs("Data", exist_ok=True)
+        raw.iloc[:rows].to_csv(csvParser.CSV_FILE_PATH, index=False)
+        movies = raw.iloc[rows:].astype(object).where(raw.iloc[rows:].notna(), None).to_dict("records")
+
+        recommender.Active_model = None
+        recommender.initdata()
+        data, parse_s = timed(csvParser.ParseMovieData, "all.csv")
+        _, factors_s = timed(recommender.buildFactors, data)
+        model, update_s = timed(recommender.update_catalog, movies)
+        _, second_update_s = timed(recommender.update_catalog, movies[:batch // 2])
+        _, compact_s = timed(recommender.compact_model)
+        report.append({
+            "rows": rows,
+            "batch": batch,
+            "rebuild_s": round(parse_s + factors_s, 3),
+            "update_s": update_s,
+            "second_update_s": second_update_s,
+            "compact_s": compact_s,
+            "live_rows": model.status()["rows"],
+        })
+        print(json.dumps(report[-1]))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental catalog update benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.rows, args.batch)
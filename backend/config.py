@@ -8,3 +8,4 @@ client = MongoClient(MONGO_URI)
 db = client.get_database(os.environ.get("MONGO_DB", "MovieRecommendations"))
 movieCollection = db["movies_metadata"]
 userCollection = db["user"]
+posterCollection = db["poster_cache"]
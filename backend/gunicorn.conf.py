@@ -0,0 +1,47 @@
+# Production serving: gunicorn -c gunicorn.conf.py server:app
+#
+# The app (catalog, factors, similarity backend, hydrator) is loaded once in the master and the
+# workers are forked from it, so the NumPy/SciPy buffers of the model are shared copy-on-write.
+# Graceful restarts: HUP restarts the workers on the already loaded model; USR2 starts a new master
+# (which loads the CSV's bundle, or the version pinned by an explicit reload) next to the old one,
+# then QUIT the old master for zero downtime.
+import gc
+import os
+import sys
+
+# A warm-up thread must not be running in the master when it forks (its locks would be copied held);
+# each worker warms its own result cache in post_fork instead
+os.environ["RESULT_WARMUP_ON_START"] = "0"
+
+bind = os.environ.get("BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("WEB_WORKERS", os.cpu_count() or 2))
+threads = int(os.environ.get("WEB_THREADS", 4))
+worker_class = "gthread"
+preload_app = True
+timeout = int(os.environ.get("WEB_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot grow without bound
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+
+def when_ready(server):
+    # Sockets opened while loading the app must not be shared by the forked workers
+    import config
+    config.client.close()
+    # Move everything loaded so far out of the GC's reach: collections would otherwise touch
+    # (and so copy) every shared page in every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    server.log.info("Worker %s forked from the preloaded model", worker.pid)
+    app = sys.modules["server"]
+    app.start_warmup(app.recommender.get_model())
+
+
+def worker_exit(server, worker):
+    # Write the likes and dislikes this worker still holds before it goes
+    sys.modules["server"].interactions.close()
@@ -1,10 +1,91 @@
-from config import movieCollection
+from pymongo import UpdateOne, ASCENDING, TEXT
+from util.bundle import file_sha256
 import pandas as pd
-import json
+import ast
+import time
 
 #used to populate the databse with initial csv data
 csv_file_path = "Data/movies_metadata.csv"
-df = pd.read_csv(csv_file_path)
+CHUNK_SIZE = 5000
 
-data = json.loads(df.to_json(orient="records"))
-movieCollection.insert_many(data)
+NUMERIC_COLUMNS = ["budget", "popularity", "revenue", "runtime", "vote_average", "vote_count"]
+#stored as real lists of objects so the server can read e.g. genre names
+LITERAL_COLUMNS = ["genres", "production_companies", "production_countries", "spoken_languages", "belongs_to_collection"]
+
+
+def parse_literal(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+#Turn one CSV chunk straight into documents (NaN -> None), skipping rows without a movie id
+def chunk_to_documents(chunk):
+    for column in NUMERIC_COLUMNS:
+        if column in chunk:
+            chunk[column] = pd.to_numeric(chunk[column], errors="coerce")
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    for column in LITERAL_COLUMNS:
+        if column in chunk:
+            chunk[column] = chunk[column].map(parse_literal)
+    documents = []
+    for doc in chunk.to_dict("records"):
+        if doc.get("id"):
+            documents.append(doc)
+    return documents
+
+
+#Indexes the server queries rely on
+def create_indexes(movies, users):
+    movies.create_index([("id", ASCENDING)])
+    movies.create_index([("title", ASCENDING)])
+    movies.create_index([("imdb_id", ASCENDING)])
+    movies.create_index([("title", TEXT)], name="title_text")
+    users.create_index([("token", ASCENDING)])
+    users.create_index([("username", ASCENDING)])
+    users.create_index([("email", ASCENDING)])
+    #Title lookups moved to the model's in-memory search; databases loaded before that still carry the index
+    if "title_normalized_1" in movies.index_information():
+        movies.drop_index("title_normalized_1")
+
+
+#Stream the CSV into Mongo with unordered bulk upserts keyed on the movie id. Progress is
+#checkpointed per chunk in `state`, so a rerun resumes where it stopped and a finished load is skipped.
+def load_movies(csv_path, movies, users, state, chunk_size=CHUNK_SIZE):
+    start = time.perf_counter()
+    source = file_sha256(csv_path)
+    checkpoint = state.find_one({"_id": "movies_metadata"}) or {}
+    if checkpoint.get("source") != source:
+        checkpoint = {"rows": 0, "done": False}
+    if checkpoint.get("done"):
+        print(f"{csv_path} already loaded ({checkpoint['rows']} rows)")
+        create_indexes(movies, users)
+        return 0
+
+    create_indexes(movies, users)
+    rows = checkpoint["rows"]
+    loaded = 0
+    chunks = pd.read_csv(csv_path, chunksize=chunk_size, dtype={"id": str, "imdb_id": str},
+                         skiprows=range(1, rows + 1), low_memory=False)
+    for chunk in chunks:
+        documents = chunk_to_documents(chunk)
+        if documents:
+            movies.bulk_write([UpdateOne({"id": doc["id"]}, {"$set": doc}, upsert=True) for doc in documents], ordered=False)
+        rows += len(chunk)
+        loaded += len(chunk)
+        state.update_one({"_id": "movies_metadata"}, {"$set": {"source": source, "rows": rows, "done": False}}, upsert=True)
+        elapsed = time.perf_counter() - start
+        print(f"{rows} rows loaded ({loaded / elapsed:.0f} rows/sec)")
+
+    state.update_one({"_id": "movies_metadata"}, {"$set": {"source": source, "rows": rows, "done": True}}, upsert=True)
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {loaded} rows in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):.0f} rows/sec)")
+    return loaded
+
+
+if __name__ == "__main__":
+    from config import movieCollection, userCollection, db
+    load_movies(csv_file_path, movieCollection, userCollection, db["load_state"])
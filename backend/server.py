@@ -1,13 +1,23 @@
-from flask import Flask, jsonify, make_response
+from flask import Flask, jsonify, g, Response
 from flask_cors import CORS
 
 from auth_routes import *
 from config import *
-from util import recommender
+from util import recommender, bundle, search
+from util.posters import PosterResolver, poster_url, TMDB_API_BASE
+from util.hydration import MovieHydrator, movie_key
+from util.interactions import InteractionQueue, QueueFull, LIKE, DISLIKE, apply_pending
+from initdb import chunk_to_documents
+from pymongo import UpdateOne
+import pandas as pd
+import numpy as np
+from util.metrics import metrics, start_trace, stop_trace, server_timing
 from bson import ObjectId 
-import hashlib
+import threading
+import atexit
+import time
 from dotenv import load_dotenv
-import os, requests
+import os
 
 load_dotenv()
 
@@ -17,29 +27,32 @@ app = Flask(__name__)
 CORS(app, supports_credentials=True, origins=["http://localhost:3000"])
 
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-TMDB_IMAGE_BASE = "https://image.tmdb.org/t/p/w185"
+
+# Cached, pooled and concurrent TMDB poster lookups (memory LRU + Mongo cache with TTL)
+posters = PosterResolver(TMDB_API_KEY, posterCollection, api_base=os.getenv("TMDB_API_BASE", TMDB_API_BASE))
 
 def get_tmdb_thumbnail(imdb_id):
     """Fetch a thumbnail URL from TMDB using an IMDb ID."""
-    if not imdb_id or not TMDB_API_KEY:
+    if not imdb_id:
         return None
-    try:
-        url = f"https://api.themoviedb.org/3/find/{imdb_id}"
-        params = {"api_key": TMDB_API_KEY, "external_source": "imdb_id"}
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("movie_results"):
-            poster_path = data["movie_results"][0].get("poster_path")
-            if poster_path:
-                return f"{TMDB_IMAGE_BASE.rstrip('/')}/{poster_path.lstrip('/')}" 
-    except Exception as e:
-        print("TMDB fetch error:", e)
-    return None
+    return posters.get(imdb_id)
+
+def resolve_posters(movies):
+    """Poster URLs for a list of movie documents, resolving all TMDB lookups in one batch."""
+    with metrics.span("posters"):
+        tmdb_posters = posters.resolve_many([movie.get("imdb_id") if movie else None for movie in movies])
+    result = []
+    for movie, url in zip(movies, tmdb_posters):
+        if not url and movie and movie.get("poster_path"):
+            url = poster_url(movie["poster_path"])
+        result.append(url)
+    return result
 
 # Flask route for title search
 from bson import ObjectId
 
+SEARCH_LIMIT = 10
+
 @app.route('/search/title', methods=['GET'])
 def search_by_title():
     title_query = request.args.get('q', '')
@@ -47,79 +60,286 @@ def search_by_title():
     if not title_query:
         return jsonify([])
 
-    # Step 1: Exact matches
-    exact_matches = list(movieCollection.find(
-        {"title": {"$regex": f"^{title_query}$", "$options": "i"}},
-        {"_id": 1, "title": 1, "imdb_id": 1, "poster_path": 1}
-    ))
+    # In-memory prefix and typo-tolerant index over the model's titles, then one $in query for the documents
+    model = use_model()
+    with metrics.span("search_index"):
+        rows = search.title_search(model).search(title_query, SEARCH_LIMIT)
+    with metrics.span("hydrate"):
+        docs = get_hydrator(model).hydrate(rows, {"_id": 1, "imdb_id": 1, "poster_path": 1})
+    unique_results = [dict(doc, title=title) for doc, title in zip(docs, model.data.titles.take(rows)) if doc is not None]
 
-    # Step 2: Text matches
-    text_matches = list(movieCollection.find(
-        {"$text": {"$search": title_query}},
-        {"_id": 1, "title": 1, "imdb_id": 1, "poster_path": 1, "score": {"$meta": "textScore"}}
-    ).sort([("score", {"$meta": "textScore"})]).limit(max(0, 10 - len(exact_matches))))
+    # Mongo full-text search only when the index has nothing
+    if not unique_results:
+        unique_results = text_search(title_query)
 
-
-    # Step 3: Combine results
-    combined_results = exact_matches + text_matches
-
-    # Step 4: Deduplicate by title (case-insensitive)
-    seen_titles = set()
     movie_list = []
-    unique_results = []
-    
-    for movie in combined_results:
-        title = movie["title"].strip().lower()
-        if title not in seen_titles:
-            seen_titles.add(title)
-            unique_results.append(movie)
-        if len(unique_results) == 10:
-            break
-        
-    for movie in unique_results:
-            poster_url = None
-            if movie.get("imdb_id"):
-                poster_url = get_tmdb_thumbnail(movie["imdb_id"])
-            if not poster_url and movie.get("poster_path"):
-                poster_url = f"{TMDB_IMAGE_BASE.rstrip('/')}/{movie['poster_path'].lstrip('/')}"
-
-            movie_list.append({
-                "id": str(movie["_id"]),
-                "title": movie["title"],
-                "poster": poster_url
-            })
+    for movie, poster in zip(unique_results, resolve_posters(unique_results)):
+        movie_list.append({
+            "id": str(movie["_id"]),
+            "title": movie["title"],
+            "poster": poster
+        })
     return jsonify(movie_list)
+
+def text_search(title_query):
+    """$text matches, best first, one per title (case-insensitive)."""
+    with metrics.span("search_text"):
+        text_matches = movieCollection.find(
+            {"$text": {"$search": title_query}},
+            {"_id": 1, "title": 1, "imdb_id": 1, "poster_path": 1, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).limit(SEARCH_LIMIT)
+
+        seen_titles = set()
+        unique_results = []
+        for movie in text_matches:
+            title = movie["title"].strip().lower()
+            if title not in seen_titles:
+                seen_titles.add(title)
+                unique_results.append(movie)
+    return unique_results
     
 @app.route('/api/MakeRecommendation', methods=['POST'])
 def recommend_movie():
-    global Movie_data
     movie_title = request.json.get("movieTitle")
     if not movie_title:
         return jsonify({"error": "Invalid movie Title"}), 400
 
-    recommendations = recommender.MakeRecommendation(Movie_data, movie_title).tolist()
-    result_list = []
-
-    for title in recommendations:
-        movie = movieCollection.find_one({"title": title}, {"poster_path": 1, "imdb_id": 1})
-        poster_url = None
-        if movie:
-            if movie.get("imdb_id"):
-                poster_url = get_tmdb_thumbnail(movie["imdb_id"])
-            if not poster_url and movie.get("poster_path"):
-                poster_url = f"{TMDB_IMAGE_BASE.rstrip('/')}/{movie['poster_path'].lstrip('/')}"
-        result_list.append({"title": title, "poster": poster_url})
-
-    return jsonify({"Recommendations": result_list}), 200
-
+    # Optional release year, as a number or a string of digits
+    year = request.json.get("year")
+    if year in (None, ""):
+        year = None
+    elif (isinstance(year, int) and not isinstance(year, bool)) or (isinstance(year, str) and year.strip().isdigit()):
+        year = int(year)
+    else:
+        return jsonify({"error": "Invalid year"}), 400
+
+    model = use_model()
+    rows = recommender.MakeRecommendationRows(model, movie_title, year)
+    if rows is None:
+        return jsonify({"error": "Movie not found"}), 404
+    return jsonify({"Recommendations": build_result_list(model, rows)}), 200
+
+# Most seed titles one /api/MakeBatchRecommendation request may carry
+RECOMMENDATION_BATCH_LIMIT = 100
+
+@app.route('/api/MakeBatchRecommendation', methods=['POST'])
+def recommend_movies_batch():
+    movie_titles = request.json.get("movieTitles")
+    if not isinstance(movie_titles, list) or not movie_titles or not all(isinstance(title, str) and title.strip() for title in movie_titles):
+        return jsonify({"error": "Invalid movie Titles"}), 400
+    if len(movie_titles) > RECOMMENDATION_BATCH_LIMIT:
+        return jsonify({"error": f"At most {RECOMMENDATION_BATCH_LIMIT} movie titles per request"}), 400
+
+    model = use_model()
+    batch = recommender.MakeBatchRecommendationRows(model, movie_titles)
+    # Hydrate every seed's results together so the whole batch costs one database query
+    found = [rows for rows in batch.values() if rows is not None]
+    results = iter(build_result_list(model, [row for rows in found for row in rows]))
+    response = {}
+    for title, rows in batch.items():
+        response[title] = None if rows is None else [next(results) for _ in rows]
+
+    return jsonify({"Recommendations": response}), 200
+
+def build_result_list(model, rows):
+    # One $in query for all documents, one batched poster lookup
+    with metrics.span("hydrate"):
+        movies = get_hydrator(model).hydrate(rows, {"poster_path": 1, "imdb_id": 1})
+    titles = model.data.titles.take(rows)
+    return [{"title": title, "poster": poster} for title, poster in zip(titles, resolve_posters(movies))]
+
+def use_model():
+    """The active model, pinned for the rest of this request and reported in X-Model-Version."""
+    if "model" not in g:
+        follow_current_model()
+        g.model = recommender.get_model()
+    return g.model
+
+@app.after_request
+def add_model_version(response):
+    if "model" in g:
+        response.headers["X-Model-Version"] = g.model.version
+    return response
 
-def get_user_from_token(auth_token):
+# Per-request stage timings in a Server-Timing header (visible in the browser's network panel)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") != "0"
 
-    hashed_token = hashlib.sha256(auth_token.encode("utf-8")).hexdigest()
-    return userCollection.find_one({"token": hashed_token})
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if SERVER_TIMING and metrics.enabled:
+        g.trace = start_trace()
+    else:
+        stop_trace()
+
+@app.after_request
+def record_request_time(response):
+    if "request_start" in g and request.endpoint != "prometheus_metrics":
+        elapsed = time.perf_counter() - g.request_start
+        metrics.observe("request_duration_seconds", elapsed, endpoint=request.endpoint or "unknown")
+        if "trace" in g:
+            response.headers["Server-Timing"] = server_timing(g.trace, elapsed)
+    return response
 
+# Poster lookups by where they were answered, from the resolver's own counters
+metrics.collect(lambda: [("poster_lookups_total", {"result": name}, value) for name, value in posters.stats.items()])
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def get_hydrator(model):
+    # Row -> _id mapping for single round-trip hydration, one per model version
+    return model.derived("hydrator", lambda: MovieHydrator(movieCollection, model.data))
+
+def prepare_model(model):
+    """Build per-version state before a model starts taking traffic."""
+    get_hydrator(model)
+    search.title_search(model)
+
+def prepare_update(model, previous):
+    """Grow the previous model's hydrator by the rows a catalog delta appended, instead of rebuilding it."""
+    deleted_rows = np.flatnonzero(model.deleted[:len(previous.data)] & ~previous.deleted)
+    model.derived("hydrator", lambda: get_hydrator(previous).appended(model.data, deleted_rows))
+    search.title_search(model)
+
+# Warm the result cache when the app starts (gunicorn.conf.py turns this off and warms each worker after the fork)
+RESULT_WARMUP_ON_START = os.getenv("RESULT_WARMUP_ON_START", "1") != "0"
+
+def start_warmup(model):
+    """Precompute recommendations for the model's most popular titles in a background thread."""
+    if recommender.RESULT_WARMUP_TITLES <= 0 or recommender.RESULT_CACHE_SIZE <= 0:
+        return False
+
+    def run():
+        try:
+            start = time.perf_counter()
+            warmed = recommender.warm_results(model)
+            print(f"Result cache warm-up: {warmed} titles for model {model.version} (revision {model.revision}) in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            print("Result cache warm-up failed:", e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return True
+
+MODEL_ADMIN_TOKEN = os.getenv("MODEL_ADMIN_TOKEN")
+# How often (seconds) a process checks whether another process activated a different model
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 5))
+reload_lock = threading.Lock()
+last_model_check = time.monotonic()
+
+def run_in_background(name, task):
+    """Run a model task (reload, catch-up, compaction) in a background thread; False if one is already running."""
+    if not reload_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            model = task()
+            print(f"{name}: activated model {model.version} (revision {model.revision})")
+            start_warmup(model)
+        except Exception as e:
+            print(f"{name} failed:", e)
+        finally:
+            reload_lock.release()
+
+    threading.Thread(target=run, daemon=True).start()
+    return True
+
+def start_reload(version=None):
+    """Build/load a model in the background and swap it in; False if a reload is already running."""
+    return run_in_background("Model reload", lambda: recommender.reload_model(version, prepare=prepare_model))
+
+def start_catch_up():
+    return run_in_background("Catalog catch-up", lambda: recommender.catch_up(prepare=prepare_update))
+
+def start_compaction():
+    return run_in_background("Catalog compaction", lambda: recommender.compact_model(prepare=prepare_model))
+
+def follow_current_model(force=False):
+    """With several worker processes, a reload in one moves the CURRENT pointer; the others follow it."""
+    global last_model_check
+    now = time.monotonic()
+    if not force and (MODEL_WATCH_INTERVAL <= 0 or now - last_model_check < MODEL_WATCH_INTERVAL):
+        return
+    last_model_check = now
+    version = bundle.current_version()
+    model = recommender.get_model()
+    if version and version != model.version:
+        start_reload(version)
+    elif bundle.latest_delta(model.version) > model.revision:
+        start_catch_up()
+
+@app.route('/api/model', methods=['GET'])
+def model_status():
+    model = use_model()
+    return jsonify(dict(model.status(), result_cache=recommender.result_cache(model).stats()))
+
+def is_admin():
+    # Admin routes are disabled unless an admin token is configured
+    return bool(MODEL_ADMIN_TOKEN) and request.headers.get("X-Admin-Token") == MODEL_ADMIN_TOKEN
+
+@app.route('/api/model/reload', methods=['POST'])
+def reload_model():
+    if not is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    version = (request.get_json(silent=True) or {}).get("version")
+    if not start_reload(version):
+        return jsonify({"error": "A reload is already running"}), 409
+    return jsonify({"message": "Reload started", "active": recommender.get_model().version}), 202
+
+@app.route('/api/catalog', methods=['POST'])
+def update_catalog():
+    """Add or replace movies ("movies": movies_metadata records) and delete movies ("deleted": ids) live."""
+    if not is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object with movies and/or deleted"}), 400
+    movies = body.get("movies") or []
+    deleted = body.get("deleted") or []
+    if not isinstance(movies, list) or not all(isinstance(m, dict) and m.get("id") not in (None, "") for m in movies):
+        return jsonify({"error": "movies must be a list of records with an id"}), 400
+    # A bare string would otherwise be taken character by character
+    if not isinstance(deleted, list) or not all(isinstance(i, (str, int, float)) and not isinstance(i, bool) and movie_key(i) for i in deleted):
+        return jsonify({"error": "deleted must be a list of movie ids"}), 400
+    deleted_ids = [movie_key(i) for i in deleted]
+    if not movies and not deleted_ids:
+        return jsonify({"error": "Nothing to update"}), 400
+    movies = [dict(movie, id=movie_key(movie["id"])) for movie in movies]
+
+    # Documents first, so the model's hydrator finds the new movies
+    documents = chunk_to_documents(pd.DataFrame(movies)) if movies else []
+    if documents:
+        movieCollection.bulk_write([UpdateOne({"id": doc["id"]}, {"$set": doc}, upsert=True) for doc in documents], ordered=False)
+    if deleted_ids:
+        movieCollection.delete_many({"id": {"$in": deleted_ids}})
 
-Movie_data = recommender.initdata()
+    try:
+        model = recommender.update_catalog(movies, deleted_ids, prepare=prepare_update)
+    except FileExistsError:
+        # Another worker appended a delta, compacted the bundle or activated another model first;
+        # follow it, the client can retry
+        follow_current_model(force=True)
+        return jsonify({"error": "Catalog changed concurrently, retry"}), 409
+    start_warmup(model)
+    compacting = recommender.needs_compaction(model) and start_compaction()
+    return jsonify({"status": model.status(), "compacting": bool(compacting)}), 200
+
+@app.route('/api/catalog/compact', methods=['POST'])
+def compact_catalog():
+    if not is_admin():
+        return jsonify({"error": "Forbidden"}), 403
+    if not start_compaction():
+        return jsonify({"error": "A reload is already running"}), 409
+    return jsonify({"message": "Compaction started"}), 202
+
+
+prepare_model(recommender.initdata())
+if RESULT_WARMUP_ON_START:
+    start_warmup(recommender.get_model())
 @app.route('/')
 def home():
     return "Hello, Flask!"
@@ -145,36 +365,14 @@ def doReturningUser():
     return login()
 
 @app.route('/logout', methods=['POST'])
-def logout():
-    response = make_response(jsonify({"message": "Logged out successfully"}))
-    response.set_cookie('auth_token', '', expires=0)
-    return response
+def doLogout():
+    return logout()
 
     
     
 @app.route('/api/dislike', methods=['POST'])
 def dislike_movie():
-    auth_token = request.cookies.get('authToken')
-    if not auth_token:
-        return jsonify({"error": "Unauthorized"}), 401
-
-    user_data = get_user_from_token(auth_token)
-    if not user_data:
-        return jsonify({"error": "User not found"}), 404
-
-    movie_id = request.json.get("movieId")
-    if movie_id:
-        # Ensure movie_id is an ObjectId
-        movie_id = ObjectId(movie_id) if not isinstance(movie_id, ObjectId) else movie_id
-        
-        # Add movie ID to dislikes if not already disliked, and remove from likes
-        userCollection.update_one(
-            {"_id": user_data["_id"]},
-            {"$addToSet": {"dislikes": movie_id}, "$pull": {"likes": movie_id}}
-        )
-        return jsonify({"message": "Movie disliked successfully"}), 200
-    else:
-        return jsonify({"error": "Invalid movie ID"}), 400
+    return rate_movie(DISLIKE, "Movie disliked successfully")
 
 
 @app.route('/api/movie/details', methods=['GET'])
@@ -219,18 +417,19 @@ def get_profile():
     if not auth_token:
         return jsonify({"error": "Unauthorized"}), 401
 
-    # Hash the token to match with the database-stored hashed token
-    hashed_token = hashlib.sha256(auth_token.encode("utf-8")).hexdigest()
-
-    # Fetch the user by the hashed token
-    user_data = userCollection.find_one({"token": hashed_token})
+    # Resolve the (cached) session, then read the ratings by _id; ratings still queued are
+    # taken before the read so that a flush finishing in between cannot hide them
+    user = get_user_from_token(auth_token)
+    pending = user and interactions.pending(user["_id"])
+    user_data = user and userCollection.find_one({"_id": user["_id"]}, {"username": 1, "likes": 1, "dislikes": 1})
 
     if not user_data:
         return jsonify({"error": "User not found"}), 404
 
     # Fetch movie titles for liked and disliked movies
-    liked_movie_ids = [ObjectId(movie_id) for movie_id in user_data.get("likes", [])]
-    disliked_movie_ids = [ObjectId(movie_id) for movie_id in user_data.get("dislikes", [])]
+    likes, dislikes = apply_pending(user_data.get("likes", []), user_data.get("dislikes", []), pending)
+    liked_movie_ids = [ObjectId(movie_id) for movie_id in likes]
+    disliked_movie_ids = [ObjectId(movie_id) for movie_id in dislikes]
 
     # Retrieve movies by IDs and get their titles
     liked_movies = movieCollection.find({"_id": {"$in": liked_movie_ids}})
@@ -251,6 +450,27 @@ def get_profile():
 
 @app.route('/api/like', methods=['POST'])
 def like_movie():
+    return rate_movie(LIKE, "Movie liked successfully")
+
+# Likes and dislikes are written behind: coalesced per user (last click wins) and flushed as one bulk_write.
+# Each worker only knows its own queued ratings; the others see them once flushed (see util.interactions).
+interactions = InteractionQueue(
+    userCollection,
+    max_pending=int(os.getenv("INTERACTION_MAX_PENDING", 10000)),
+    flush_interval=float(os.getenv("INTERACTION_FLUSH_INTERVAL", 0.05)),
+    submit_timeout=float(os.getenv("INTERACTION_SUBMIT_TIMEOUT", 1)),
+)
+atexit.register(interactions.close)
+metrics.collect(lambda: [("interaction_events_total", {"result": name}, value) for name, value in interactions.stats.items()])
+
+# Most ratings one /api/interactions request may carry
+INTERACTION_BATCH_LIMIT = 500
+ACTIONS = {"like": LIKE, "dislike": DISLIKE}
+
+def queue_full():
+    return jsonify({"error": "Too many ratings waiting to be saved, try again shortly"}), 503, {"Retry-After": "1"}
+
+def rate_movie(value, message):
     auth_token = request.cookies.get('authToken')
     if not auth_token:
         return jsonify({"error": "Unauthorized"}), 401
@@ -259,20 +479,90 @@ def like_movie():
     if not user_data:
         return jsonify({"error": "User not found"}), 404
 
-    movie_id = request.json.get("movieId")
-    if movie_id:
-        # Ensure movie_id is an ObjectId
-        movie_id = ObjectId(movie_id) if not isinstance(movie_id, ObjectId) else movie_id
-        
-        # Add movie ID to likes if not already liked, and remove from dislikes
-        userCollection.update_one(
-            {"_id": user_data["_id"]},
-            {"$addToSet": {"likes": movie_id}, "$pull": {"dislikes": movie_id}}
-        )
-        return jsonify({"message": "Movie liked successfully"}), 200
-    else:
+    body = request.get_json(silent=True)
+    movie_id = body.get("movieId") if isinstance(body, dict) else None
+    if not movie_id or not ObjectId.is_valid(movie_id):
         return jsonify({"error": "Invalid movie ID"}), 400
 
+    if not save_ratings(user_data["_id"], [(ObjectId(movie_id), value)]):
+        return queue_full()
+    return jsonify({"message": message}), 200
+
+@app.route('/api/interactions', methods=['POST'])
+def rate_movies():
+    """Several likes/dislikes in one request: {"events": [{"movieId": ..., "action": "like" | "dislike"}, ...]}, in click order."""
+    auth_token = request.cookies.get('authToken')
+    if not auth_token:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_data = get_user_from_token(auth_token)
+    if not user_data:
+        return jsonify({"error": "User not found"}), 404
+
+    body = request.get_json(silent=True)
+    events = body.get("events") if isinstance(body, dict) else None
+    if not isinstance(events, list) or not events:
+        return jsonify({"error": "events must be a non-empty list"}), 400
+    if len(events) > INTERACTION_BATCH_LIMIT:
+        return jsonify({"error": f"At most {INTERACTION_BATCH_LIMIT} events per request"}), 400
+
+    ratings = []
+    for event in events:
+        if not isinstance(event, dict) or not isinstance(event.get("action"), str):
+            return jsonify({"error": "Each event needs a valid movieId and an action of like or dislike"}), 400
+        movie_id = event.get("movieId")
+        value = ACTIONS.get(event["action"])
+        if not movie_id or not ObjectId.is_valid(movie_id) or value is None:
+            return jsonify({"error": "Each event needs a valid movieId and an action of like or dislike"}), 400
+        ratings.append((ObjectId(movie_id), value))
+
+    if not save_ratings(user_data["_id"], ratings):
+        return queue_full()
+    return jsonify({"accepted": len(ratings)}), 200
+
+def save_ratings(user_id, ratings):
+    """Queue (movie_id, 1 | -1) ratings for writing and apply them to the cached taste profile; False when the queue stays full."""
+    try:
+        interactions.submit(user_id, ratings)
+    except QueueFull:
+        return False
+    for movie_id, value in ratings:
+        update_profile(user_id, movie_id, value)
+    return True
+
+def update_profile(user_id, movie_id, value):
+    # Keep the cached taste profile in step with the rating: one row added or removed
+    model = use_model()
+    row = get_hydrator(model).row_of.get(movie_id)
+    if row is not None:
+        recommender.get_profiles(model).rate(user_id, row, value)
+
+@app.route('/api/MakePersonalRecommendation', methods=['GET'])
+def recommend_for_user():
+    auth_token = request.cookies.get('authToken')
+    if not auth_token:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    user_data = get_user_from_token(auth_token)
+    if not user_data:
+        return jsonify({"error": "User not found"}), 404
+
+    model = use_model()
+    hydrator = get_hydrator(model)
+
+    def load_ratings():
+        # Only needed when the profile is not cached yet
+        pending = interactions.pending(user_data["_id"])
+        ratings = userCollection.find_one({"_id": user_data["_id"]}, {"likes": 1, "dislikes": 1}) or {}
+        likes, dislikes = apply_pending(ratings.get("likes", []), ratings.get("dislikes", []), pending)
+        return hydrator.rows_for(likes), hydrator.rows_for(dislikes)
+
+    profile = recommender.get_profiles(model).snapshot(user_data["_id"], load_ratings)
+    rows = recommender.PersonalRecommendationRows(model, profile)
+    if rows is None:
+        return jsonify({"Recommendations": []}), 200
+    return jsonify({"Recommendations": build_result_list(model, rows)}), 200
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=8080, debug=True)
 
@@ -0,0 +1,87 @@
+#Catalog updates and compaction racing across two processes that share one model directory
+#Run from backend/:  python -m pytest tests
+import multiprocessing
+import os
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate_catalog
+from util import bundle, csvParser, recommender
+
+ROWS = 300
+fork = multiprocessing.get_context("fork")
+
+
+@pytest.fixture
+def movies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(recommender, "Active_model", None)
+    generate_catalog("all.csv", ROWS + 2)
+    raw = pd.read_csv("all.csv", low_memory=False)
+    os.makedirs("Data", exist_ok=True)
+    raw.iloc[:ROWS].to_csv(csvParser.CSV_FILE_PATH, index=False)
+    tail = raw.iloc[ROWS:].astype(object).where(raw.iloc[ROWS:].notna(), None).to_dict("records")
+    return [dict(movie, title=title) for movie, title in zip(tail, ["First Added", "Second Added"])]
+
+
+#Run fn in a forked process, which starts from this process's model, and return what it returned or raised
+def in_other_process(fn):
+    results = fork.Queue()
+
+    def run():
+        try:
+            results.put(("ok", fn()))
+        except Exception as e:
+            results.put(("error", type(e).__name__))
+
+    process = fork.Process(target=run)
+    process.start()
+    result = results.get(timeout=60)
+    process.join(10)
+    return result
+
+
+def restarted_titles():
+    recommender.Active_model = None
+    return set(recommender.initdata().data.titles)
+
+
+def test_compaction_replays_a_delta_added_by_another_process(movies):
+    base = recommender.initdata()
+    recommender.update_catalog(movies[:1])
+    #the other worker adds a delta this process has not seen
+    assert in_other_process(lambda: recommender.update_catalog(movies[1:]).revision) == ("ok", 2)
+
+    compacted = recommender.compact_model()
+    assert compacted.revision == 0 and bundle.current_version() == compacted.version
+    assert {"First Added", "Second Added"} <= set(compacted.data.titles)
+    assert {"First Added", "Second Added"} <= restarted_titles()
+    #the compacted-away bundle takes no more deltas
+    recommender.Active_model = recommender.load_model(base.version)
+    with pytest.raises(FileExistsError):
+        recommender.update_catalog(movies[:1])
+
+
+def test_update_from_a_stale_process_is_refused_after_compaction(movies):
+    recommender.initdata()
+    recommender.update_catalog(movies[:1])
+    status, compacted_version = in_other_process(lambda: recommender.compact_model().version)
+    assert status == "ok" and bundle.current_version() == compacted_version
+
+    #this process still serves the base version
+    with pytest.raises(FileExistsError):
+        recommender.update_catalog(movies[1:])
+    assert bundle.current_version() == compacted_version
+    assert "First Added" in restarted_titles()
+
+
+def test_stale_process_cannot_compact_again(movies):
+    base = recommender.initdata()
+    status, compacted_version = in_other_process(lambda: recommender.compact_model().version)
+    assert status == "ok"
+
+    with pytest.raises(FileExistsError):
+        recommender.compact_model()
+    assert recommender.get_model().version == base.version
+    assert bundle.current_version() == compacted_version
@@ -0,0 +1,148 @@
+#Write-behind interaction queue on an in-memory Mongo stand-in
+#Run from backend/:  python -m pytest tests
+import threading
+import time
+
+import pytest
+from bson import ObjectId
+
+from util.interactions import InteractionQueue, QueueFull, LIKE, DISLIKE
+
+mongomock = pytest.importorskip("mongomock")
+
+
+#A users collection whose bulk_write can be made to fail or to block until released
+class Users:
+    def __init__(self):
+        self.collection = mongomock.MongoClient().db.users
+        self.failures = 0
+        self.release = None
+        self.entered = threading.Event()
+        self.calls = 0
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls += 1
+        self.entered.set()
+        if self.release is not None:
+            self.release.wait(5)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("write failed")
+        return self.collection.bulk_write(operations, ordered=ordered)
+
+    def add_user(self):
+        return self.collection.insert_one({"likes": [], "dislikes": []}).inserted_id
+
+    def ratings(self, user_id):
+        user = self.collection.find_one({"_id": user_id})
+        return set(user["likes"]), set(user["dislikes"])
+
+
+@pytest.fixture
+def users():
+    return Users()
+
+
+def test_last_rating_of_a_movie_wins(users):
+    user_id = users.add_user()
+    first, second = ObjectId(), ObjectId()
+    queue = InteractionQueue(users, flush_interval=10)
+    queue.submit(user_id, [(first, LIKE), (second, LIKE)])
+    queue.submit(user_id, [(first, DISLIKE), (first, LIKE), (first, DISLIKE)])
+    queue.close()
+
+    assert users.ratings(user_id) == ({second}, {first})
+    assert queue.stats["coalesced"] == 3
+    #one update for the likes, one for the dislikes, in a single bulk_write
+    assert users.calls == 1 and queue.stats["writes"] == 2
+
+
+def test_close_writes_what_is_left(users):
+    user_ids = [users.add_user() for _ in range(3)]
+    movie = ObjectId()
+    queue = InteractionQueue(users, flush_interval=10)
+    for user_id in user_ids:
+        queue.submit(user_id, [(movie, LIKE)])
+    queue.close()
+
+    assert all(users.ratings(user_id) == ({movie}, set()) for user_id in user_ids)
+    assert queue.pending(user_ids[0]) == {}
+    with pytest.raises(QueueFull):
+        queue.submit(user_ids[0], [(movie, DISLIKE)])
+
+
+def test_pending_covers_a_flush_in_flight(users):
+    user_id = users.add_user()
+    movie = ObjectId()
+    users.release = threading.Event()
+    queue = InteractionQueue(users, flush_interval=0.01)
+    queue.submit(user_id, [(movie, LIKE)])
+
+    assert users.entered.wait(5)
+    assert queue.pending(user_id) == {movie: LIKE}
+    assert users.ratings(user_id) == (set(), set())
+    users.release.set()
+    queue.close()
+    assert users.ratings(user_id) == ({movie}, set())
+    assert queue.pending(user_id) == {}
+
+
+def test_failed_flush_is_retried_under_newer_ratings(users):
+    user_id = users.add_user()
+    first, second = ObjectId(), ObjectId()
+    users.failures = 1
+    users.release = threading.Event()
+    #the retry comes 0.4 s after the failure, long after pending() is checked
+    queue = InteractionQueue(users, flush_interval=0.2)
+    queue.submit(user_id, [(first, LIKE), (second, LIKE)])
+
+    #a newer rating arrives while the failing flush is in flight
+    assert users.entered.wait(5)
+    queue.submit(user_id, [(first, DISLIKE)])
+    users.release.set()
+    deadline = time.monotonic() + 5
+    while queue.stats["write_errors"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue.pending(user_id) == {first: DISLIKE, second: LIKE}
+
+    queue.close()
+    assert queue.stats["write_errors"] == 1
+    assert users.ratings(user_id) == ({second}, {first})
+
+
+def test_ratings_are_written_directly_while_flushes_fail(users):
+    user_id = users.add_user()
+    first, second = ObjectId(), ObjectId()
+    users.failures = 1
+    #the flusher's retry is seconds away, so a direct write is the only way the rating lands now
+    queue = InteractionQueue(users, flush_interval=1)
+    queue.submit(user_id, [(first, LIKE)])
+    with queue.condition:
+        queue.condition.notify_all()
+    deadline = time.monotonic() + 5
+    while not queue.failures and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue.failures
+
+    queue.submit(user_id, [(second, DISLIKE)])
+    #the requeued rating went out with the new one
+    assert users.ratings(user_id) == ({first}, {second})
+    assert queue.stats["direct_writes"] == 1
+    assert queue.failures == 0 and queue.pending(user_id) == {}
+    queue.close()
+
+
+def test_full_queue_rejects_after_the_timeout(users):
+    user_id = users.add_user()
+    users.release = threading.Event()
+    queue = InteractionQueue(users, max_pending=2, flush_interval=0.01, submit_timeout=0.1)
+    queue.submit(user_id, [(ObjectId(), LIKE)])
+    assert users.entered.wait(5)
+    queue.submit(user_id, [(ObjectId(), LIKE), (ObjectId(), LIKE)])
+
+    with pytest.raises(QueueFull):
+        queue.submit(user_id, [(ObjectId(), LIKE)])
+    assert queue.stats["rejected"] == 1
+    users.release.set()
+    queue.close()
+    assert len(users.ratings(user_id)[0]) == 3
@@ -0,0 +1,64 @@
+#Poster cache hit rates, expiry and latency against the benchmark's local TMDB stub
+#Run from backend/:  python -m pytest tests
+from datetime import timedelta
+import time
+
+import pytest
+
+from benchmarks.poster_benchmark import stub_tmdb, serial_uncached, timed
+from util.posters import PosterResolver
+
+LATENCY = 0.05
+IMDB_IDS = [f"tt{i:07d}" for i in range(1, 21)]
+#the stub has no poster for every fifth id
+MISSING = [i for i in IMDB_IDS if int(i[2:]) % 5 == 0]
+
+
+@pytest.fixture
+def api_base():
+    server, api_base = stub_tmdb(LATENCY)
+    yield api_base
+    server.shutdown()
+
+
+def test_warm_lookups_come_from_memory(api_base):
+    resolver = PosterResolver("stub", api_base=api_base)
+    cold = resolver.resolve_many(IMDB_IDS)
+    assert [url is None for url in cold] == [i in MISSING for i in IMDB_IDS]
+    assert cold[0].endswith(f"/{IMDB_IDS[0]}.jpg")
+    assert resolver.stats["fetches"] == len(IMDB_IDS)
+
+    assert resolver.resolve_many(IMDB_IDS) == cold
+    assert resolver.stats["fetches"] == len(IMDB_IDS)
+    assert resolver.stats["memory_hits"] == len(IMDB_IDS)
+
+
+def test_missing_posters_expire_from_memory(api_base):
+    resolver = PosterResolver("stub", api_base=api_base, negative_ttl=timedelta(seconds=0.2))
+    resolver.resolve_many(IMDB_IDS)
+    time.sleep(0.3)
+    resolver.resolve_many(IMDB_IDS)
+    #only the "no poster" answers are asked for again
+    assert resolver.stats["fetches"] == len(IMDB_IDS) + len(MISSING)
+    assert resolver.stats["memory_hits"] == len(IMDB_IDS) - len(MISSING)
+
+
+def test_persistent_cache_survives_a_restart(api_base):
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.poster_cache
+    cold = PosterResolver("stub", collection, api_base=api_base).resolve_many(IMDB_IDS)
+
+    restarted = PosterResolver("stub", collection, api_base=api_base)
+    assert restarted.resolve_many(IMDB_IDS) == cold
+    assert restarted.stats["fetches"] == 0
+    assert restarted.stats["store_hits"] == len(IMDB_IDS)
+
+
+def test_concurrent_and_cached_lookups_beat_serial_requests(api_base):
+    resolver = PosterResolver("stub", api_base=api_base)
+    serial_ms = timed(serial_uncached, api_base, IMDB_IDS)
+    cold_ms = timed(resolver.resolve_many, IMDB_IDS)
+    warm_ms = timed(resolver.resolve_many, IMDB_IDS)
+    #8 fetches in flight instead of one: several times faster even on a loaded machine
+    assert cold_ms < serial_ms / 2
+    assert warm_ms < LATENCY * 1000
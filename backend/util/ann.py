@@ -0,0 +1,81 @@
+from util.similarity import SimilarityEngine, top_k
+import scipy.sparse as sp
+import numpy as np
+
+
+#Approximate nearest-neighbour index (IVF): rows are clustered with spherical k-means and
+#a query only scores the rows of the n_probe clusters whose centroids are closest to it
+class IVFIndex(SimilarityEngine):
+    def __init__(self, movie_factors, n_lists=None, n_probe=8, n_iter=10, sample_size=50000, seed=42):
+        super().__init__(movie_factors)
+        n = len(self)
+        self.n_lists = max(1, min(n, n_lists or int(np.sqrt(n))))
+        self.n_probe = n_probe
+        rng = np.random.default_rng(seed)
+
+        #Train centroids on a sample, then assign every row to its closest centroid
+        sample = self.factors
+        if n > sample_size:
+            sample = self.factors[np.sort(rng.choice(n, sample_size, replace=False))]
+        self.centroids = train_centroids(sample, self.n_lists, n_iter, rng)
+        assignments = assign(self.factors, self.centroids)
+
+        #Inverted lists stored as one row array sorted by list, plus offsets per list
+        self.list_rows = np.argsort(assignments, kind="stable")
+        self.list_offsets = np.searchsorted(assignments[self.list_rows], np.arange(self.n_lists + 1))
+
+    #New rows are assigned to the existing centroids; the clustering itself is only retrained on a rebuild
+    def appended(self, movie_factors):
+        engine = super().appended(movie_factors)
+        new_rows = np.arange(len(self), len(engine))
+        lists = np.concatenate([np.repeat(np.arange(self.n_lists), np.diff(self.list_offsets)),
+                                assign(engine.factors[len(self):], self.centroids)])
+        order = np.argsort(lists, kind="stable")
+        engine.list_rows = np.concatenate([self.list_rows, new_rows])[order]
+        engine.list_offsets = np.searchsorted(lists[order], np.arange(self.n_lists + 1))
+        return engine
+
+    #Rows belonging to the n_probe lists closest to a dense query vector
+    def candidates(self, query, n_probe=None):
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        probes = top_k(self.centroids @ query, n_probe)
+        return np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probes])
+
+    #Same contract as SimilarityEngine.query, but only probed rows are scored
+    def query(self, movie_idx, k, n_probe=None):
+        query = self.rows([movie_idx])[0]
+        rows = self.candidates(query, n_probe)
+        rows = rows[rows != movie_idx]
+        scores = self.factors[rows] @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def query_batch(self, movie_indices, k, chunk_size=256):
+        return [self.query(movie_idx, k) for movie_idx in movie_indices]
+
+
+#Spherical k-means over L2-normalized sparse rows; returns dense, normalized centroids
+def train_centroids(factors, n_lists, n_iter, rng):
+    n = factors.shape[0]
+    centroids = factors[rng.choice(n, n_lists, replace=False)].toarray()
+    for _ in range(n_iter):
+        assignments = assign(factors, centroids)
+        membership = sp.csr_matrix((np.ones(n, dtype=np.float32), (assignments, np.arange(n))), shape=(n_lists, n))
+        sums = np.asarray((membership @ factors).todense())
+        #Re-seed empty lists with random rows so every list stays in use
+        empty = np.flatnonzero(np.asarray(membership.sum(axis=1)).ravel() == 0)
+        if len(empty):
+            sums[empty] = factors[rng.choice(n, len(empty), replace=False)].toarray()
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+#Index of the closest centroid for every row, in chunks to bound memory
+def assign(factors, centroids, chunk_size=8192):
+    assignments = np.empty(factors.shape[0], dtype=np.int64)
+    for start in range(0, factors.shape[0], chunk_size):
+        scores = factors[start:start + chunk_size] @ centroids.T
+        assignments[start:start + chunk_size] = np.asarray(scores).argmax(axis=1)
+    return assignments
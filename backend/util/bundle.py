@@ -0,0 +1,311 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from util.catalog import Catalog
+import scipy.sparse as sp
+import numpy as np
+import hashlib
+import fcntl
+import shutil
+import json
+import os
+
+#Versioned model bundles, one directory per (CSV content, parser version, settings) version:
+#catalog rows, factor matrix, fitted vocabularies and a manifest with checksums of each file.
+#Catalog updates are appended as numbered deltas under deltas/ until compaction writes a new bundle.
+MODEL_DIR = os.environ.get("MODEL_DIR", "models")
+CURRENT_FILE = "CURRENT"
+#Names a version activated on purpose (e.g. a rollback), which a restart keeps instead of the CSV's
+PINNED_FILE = "PINNED"
+BUNDLE_FORMAT = 1
+CATALOG_FILE = "catalog.npz"
+FACTORS_FILE = "factors.npz"
+VOCABULARY_FILE = "vocabulary.json"
+MANIFEST_FILE = "manifest.json"
+DELTA_DIR = "deltas"
+#Created when a bundle's compaction starts; no delta is added to it after that
+SEALED_FILE = "SEALED"
+LOCK_FILE = "LOCK"
+
+
+#Content hash of the CSV combined with everything else the bundle depends on
+def bundle_version(csv_file_path, *settings):
+    digest = hashlib.sha256(file_sha256(csv_file_path).encode("utf-8"))
+    digest.update(repr(settings).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+#The catalog is saved as the arrays of a util.catalog.Catalog, so loading never unpickles Python objects
+def save_catalog(path, data):
+    with open(path, "wb") as f:
+        np.savez(f, **data.arrays())
+    return list(Catalog.COLUMNS)
+
+
+def load_catalog(path, columns):
+    with np.load(path) as arrays:
+        return Catalog.from_arrays(arrays, columns)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def bundle_path(version):
+    return os.path.join(MODEL_DIR, version)
+
+
+#Version of the bundle a compaction writes: a new directory, so readers of the old one are unaffected
+def compacted_version(version, revision):
+    return hashlib.sha256(f"{version}+{revision}".encode("utf-8")).hexdigest()[:32]
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"unsupported bundle format {manifest.get('format')}")
+    return manifest
+
+
+def verify_files(directory, manifest):
+    for name, checksum in manifest["files"].items():
+        if file_sha256(os.path.join(directory, name)) != checksum:
+            raise ValueError(f"checksum mismatch for {name}")
+
+
+#Catalog, factors, vocabulary and manifest of a bundle, or None when it is missing or corrupt
+def load(version, verify=True):
+    directory = bundle_path(version)
+    try:
+        manifest = read_manifest(directory)
+        if verify:
+            verify_files(directory, manifest)
+        data = load_catalog(os.path.join(directory, CATALOG_FILE), manifest["columns"])
+        movie_factors = sp.load_npz(os.path.join(directory, FACTORS_FILE)).tocsr()
+        with open(os.path.join(directory, VOCABULARY_FILE), encoding="utf-8") as f:
+            vocabulary = json.load(f)
+    except (OSError, ValueError, KeyError) as e:
+        if os.path.isdir(directory):
+            print(f"Ignoring unreadable model bundle {version}:", e)
+        return None
+    return data, movie_factors, vocabulary, manifest
+
+
+#Write a bundle into a temporary directory and move it into place in one rename
+def save(version, data, movie_factors, vocabulary, **source):
+    directory = bundle_path(version)
+    tmp_directory = directory + f".tmp{os.getpid()}"
+    os.makedirs(tmp_directory, exist_ok=True)
+    columns = save_catalog(os.path.join(tmp_directory, CATALOG_FILE), data)
+    sp.save_npz(os.path.join(tmp_directory, FACTORS_FILE), movie_factors, compressed=False)
+    with open(os.path.join(tmp_directory, VOCABULARY_FILE), "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f)
+
+    files = [CATALOG_FILE, FACTORS_FILE, VOCABULARY_FILE]
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "rows": len(data),
+        "features": movie_factors.shape[1],
+        "columns": columns,
+        "source": source,
+        "files": {name: file_sha256(os.path.join(tmp_directory, name)) for name in files},
+    }
+    with open(os.path.join(tmp_directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return manifest
+
+
+def delta_path(version, sequence):
+    return os.path.join(bundle_path(version), DELTA_DIR, f"{sequence:06d}")
+
+
+#Persist one batch of catalog changes as delta number `sequence` of a bundle: the appended catalog
+#rows with their factor rows, and the ids tombstoned by the batch. The rename fails if the sequence
+#already exists, so two processes can never both write the same delta.
+def save_delta(version, sequence, data, movie_factors, deleted_ids):
+    directory = delta_path(version, sequence)
+    tmp_directory = directory + f".tmp{os.getpid()}"
+    os.makedirs(tmp_directory, exist_ok=True)
+    columns = save_catalog(os.path.join(tmp_directory, CATALOG_FILE), data)
+    sp.save_npz(os.path.join(tmp_directory, FACTORS_FILE), movie_factors, compressed=False)
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": version,
+        "sequence": sequence,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "rows": len(data),
+        "columns": columns,
+        "deleted_ids": [str(i) for i in deleted_ids],
+        "files": {name: file_sha256(os.path.join(tmp_directory, name)) for name in (CATALOG_FILE, FACTORS_FILE)},
+    }
+    with open(os.path.join(tmp_directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    try:
+        with bundle_lock(version):
+            if is_sealed(version):
+                raise FileExistsError(f"model bundle {version} is compacted")
+            if os.path.exists(directory):
+                raise FileExistsError(directory)
+            os.replace(tmp_directory, directory)
+    except OSError as e:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        if os.path.exists(directory):
+            raise FileExistsError(directory) from e
+        raise
+    return manifest
+
+
+#Held, across processes, while a delta is moved into place or the bundle is sealed: once seal()
+#returns, every delta is either visible in the bundle or will be refused
+@contextmanager
+def bundle_lock(version):
+    with open(os.path.join(bundle_path(version), LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+#Make a bundle read-only for catalog updates as its compaction starts; False if another process
+#already did (it is compacting or has compacted the bundle)
+def seal(version):
+    with bundle_lock(version):
+        try:
+            os.close(os.open(os.path.join(bundle_path(version), SEALED_FILE), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+    return True
+
+
+#Reopen a bundle whose compaction was abandoned
+def unseal(version):
+    with bundle_lock(version):
+        try:
+            os.remove(os.path.join(bundle_path(version), SEALED_FILE))
+        except FileNotFoundError:
+            pass
+
+
+def is_sealed(version):
+    return os.path.exists(os.path.join(bundle_path(version), SEALED_FILE))
+
+
+def delta_sequences(version):
+    try:
+        return sorted(int(name) for name in os.listdir(os.path.join(bundle_path(version), DELTA_DIR)) if name.isdigit())
+    except OSError:
+        return []
+
+
+#Highest delta number of a bundle (0 when it has none)
+def latest_delta(version):
+    sequences = delta_sequences(version)
+    return sequences[-1] if sequences else 0
+
+
+#Deltas after `after`, in order, as (sequence, catalog rows, factor rows, tombstoned ids); stops at
+#the first gap or unreadable delta so a model never skips a batch
+def load_deltas(version, after=0, verify=True):
+    deltas = []
+    for sequence in delta_sequences(version):
+        if sequence <= after:
+            continue
+        if sequence != after + len(deltas) + 1:
+            break
+        directory = delta_path(version, sequence)
+        try:
+            manifest = read_manifest(directory)
+            if verify:
+                verify_files(directory, manifest)
+            data = load_catalog(os.path.join(directory, CATALOG_FILE), manifest["columns"])
+            movie_factors = sp.load_npz(os.path.join(directory, FACTORS_FILE)).tocsr()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable delta {sequence} of model bundle {version}:", e)
+            break
+        deltas.append((sequence, data, movie_factors, manifest["deleted_ids"]))
+    return deltas
+
+
+#The version CURRENT points at when it is a compaction of `version`, which then supersedes it
+def compacted_descendant(version):
+    current = current_version()
+    if not current or current == version:
+        return None
+    try:
+        manifest = read_manifest(bundle_path(current))
+    except (OSError, ValueError):
+        return None
+    return current if manifest.get("source", {}).get("base_version") == version else None
+
+
+#Version named by the CURRENT pointer, or None before the first build
+def current_version():
+    try:
+        with open(os.path.join(MODEL_DIR, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+#Point CURRENT at a version; the pointer file is replaced atomically
+def set_current(version):
+    with pointer_lock():
+        write_pointer(CURRENT_FILE, version)
+
+
+#Point CURRENT at version only while it still names `expected` (or nothing); False if another process
+#moved it elsewhere
+def replace_current(expected, version):
+    with pointer_lock():
+        if current_version() not in (expected, None):
+            return False
+        write_pointer(CURRENT_FILE, version)
+    return True
+
+
+@contextmanager
+def pointer_lock():
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    with open(os.path.join(MODEL_DIR, CURRENT_FILE + ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_pointer(name, version):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    tmp_path = os.path.join(MODEL_DIR, name + f".tmp{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(MODEL_DIR, name))
+
+
+#Version pinned by an explicit reload, or None when the CSV decides
+def pinned_version():
+    try:
+        with open(os.path.join(MODEL_DIR, PINNED_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def pin(version):
+    write_pointer(PINNED_FILE, version)
+
+
+def unpin():
+    try:
+        os.remove(os.path.join(MODEL_DIR, PINNED_FILE))
+    except FileNotFoundError:
+        pass
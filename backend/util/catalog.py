@@ -0,0 +1,110 @@
+import pandas as pd
+import numpy as np
+
+
+#Strings packed as one UTF-8 buffer plus offsets: a few bytes per row instead of a Python object each,
+#decoded only for the rows that are read
+class StringTable:
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = [str(v).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.buffer[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        raw = self.buffer.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield raw[start:end].decode("utf-8")
+
+    #Decoded strings of the given rows, as an object array
+    def take(self, rows):
+        values = np.empty(len(rows), dtype=object)
+        values[:] = [self[row] for row in rows]
+        return values
+
+    def subset(self, rows):
+        return StringTable.from_values(self.take(rows))
+
+    def concat(self, other):
+        return StringTable(np.concatenate([self.buffer, other.buffer]),
+                           np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]]))
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes + self.offsets.nbytes
+
+
+#Release year of each 'YYYY-MM-DD' date, 0 when unknown
+def release_years(dates):
+    years = pd.Series(dates, dtype=object).fillna('').astype(str).str[:4]
+    return np.where(years.str.isdigit(), years, "0").astype(np.int32)
+
+
+#The catalog columns serving needs: movie ids and titles as packed strings, release years and the
+#two rerank inputs as NumPy arrays. The text the factors were built from is not kept.
+class Catalog:
+    COLUMNS = ['id', 'title', 'year', 'vote_average', 'popularity']
+
+    def __init__(self, ids, titles, years, vote_average, popularity):
+        self.ids = ids
+        self.titles = titles
+        self.years = years
+        self.vote_average = vote_average
+        self.popularity = popularity
+
+    #From the DataFrame csvParser.PrepareMovieData returns
+    @classmethod
+    def from_frame(cls, data):
+        return cls(StringTable.from_values(data['id']), StringTable.from_values(data['title']),
+                   release_years(data['release_date']),
+                   data['vote_average'].to_numpy(dtype=np.float64), data['popularity'].to_numpy(dtype=np.float64))
+
+    #From the arrays of a saved catalog. Bundles written before the compact catalog also hold the text
+    #and list columns (never read) and release_date instead of year.
+    @classmethod
+    def from_arrays(cls, arrays, columns):
+        def strings(column):
+            return StringTable(arrays[f"str:{column}:buffer"], arrays[f"str:{column}:offsets"])
+        years = arrays["num:year"] if "year" in columns else release_years(list(strings("release_date")))
+        return cls(strings("id"), strings("title"), years.astype(np.int32),
+                   arrays["num:vote_average"].astype(np.float64), arrays["num:popularity"].astype(np.float64))
+
+    def arrays(self):
+        return {
+            "str:id:buffer": self.ids.buffer, "str:id:offsets": self.ids.offsets,
+            "str:title:buffer": self.titles.buffer, "str:title:offsets": self.titles.offsets,
+            "num:year": self.years,
+            "num:vote_average": self.vote_average,
+            "num:popularity": self.popularity,
+        }
+
+    def __len__(self):
+        return len(self.years)
+
+    #Catalog of the given rows, in that order
+    def subset(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        return Catalog(self.ids.subset(rows), self.titles.subset(rows), self.years[rows],
+                       self.vote_average[rows], self.popularity[rows])
+
+    #This catalog followed by the rows of other
+    def appended(self, other):
+        return Catalog(self.ids.concat(other.ids), self.titles.concat(other.titles),
+                       np.concatenate([self.years, other.years]),
+                       np.concatenate([self.vote_average, other.vote_average]),
+                       np.concatenate([self.popularity, other.popularity]))
+
+    def nbytes(self):
+        return self.ids.nbytes + self.titles.nbytes + self.years.nbytes + self.vote_average.nbytes + self.popularity.nbytes
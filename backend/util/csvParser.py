@@ -1,45 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import ast
 
+CSV_FILE_PATH = 'Data/movies_metadata.csv'
+#Bump whenever the parsed output changes, so cached catalogs built by older code are not reused
+PARSER_VERSION = 2
+#Source columns the parsed catalog is built from
+RAW_COLUMNS = ['id', 'title', 'genres', 'overview', 'tagline', 'production_companies', 'vote_average', 'popularity', 'release_date']
+
 
 def parse_genres(x):
     try:
-        genres = ast.literal_eval(x)
+        # catalog updates send real lists, the CSV has their Python literal
+        genres = x if isinstance(x, list) else ast.literal_eval(x)
         genres_list = []
         for g in genres:
             genres_list.append(g['name'])
-        # concate into a single string instead of a list of genres
-        result = ', '.join(genres_list)
-        return result
-    except (TypeError):
-        return ""
+        # keep real genre names so the binarizer sees tokens, not characters
+        return genres_list
+    except (TypeError, ValueError, SyntaxError):
+        return []
     
 
 def parse_production_companies(x):
     try:
-        companies = ast.literal_eval(x)
+        companies = x if isinstance(x, list) else ast.literal_eval(x)
         companies_list = [c['name'] for c in companies if 'name' in c]
-        result = ', '.join(companies_list)
-        return result
+        return companies_list
     except (TypeError, ValueError, SyntaxError):
-        return ""
-    
-def ParseMovieData():
-    csv_file_path = 'Data/movies_metadata.csv'
-    
+        return []
+
+
+def _parse_chunk(parser, values):
+    return [parser(x) for x in values]
+
+#Run a literal_eval based parser over a column, split into chunks across a process pool
+def parse_column(values, parser, chunk_size=5000, workers=None):
+    values = list(values)
+    if len(values) <= chunk_size:
+        return _parse_chunk(parser, values)
+    chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [x for part in pool.map(_parse_chunk, [parser] * len(chunks), chunks) for x in part]
+
+def ParseMovieData(csv_file_path=CSV_FILE_PATH):
     # Load the dataset with low_memory=False to avoid DtypeWarning
     df = pd.read_csv(csv_file_path, low_memory=False)
-    
+    return PrepareMovieData(df)
+
+#Reduce raw movies_metadata rows (from the CSV or a catalog update) to the columns the model uses
+def PrepareMovieData(df):
+    missing = [column for column in RAW_COLUMNS if column not in df]
+    if missing:
+        df = df.assign(**dict.fromkeys(missing, None))
+
     # Ensure 'vote_average' and 'vote_count' columns are numeric
     df['vote_average'] = pd.to_numeric(df['vote_average'], errors='coerce')
     df['popularity'] = pd.to_numeric(df['popularity'], errors='coerce')
     
-    content_df = df[['title', 'genres', 'overview', 'tagline', 'production_companies','vote_average','popularity']]
+    content_df = df[RAW_COLUMNS].copy()
+    # Missing numbers count as 0 so the numeric columns stay numeric, everything else is ''
+    content_df[['vote_average', 'popularity']] = content_df[['vote_average', 'popularity']].fillna(0)
     content_df = content_df.fillna('')
-    content_df['genres'] = content_df['genres'].fillna('').apply(parse_genres)
-    
-    content_df['production_companies'] = content_df['production_companies'].fillna('').apply(parse_production_companies)
-    content_df['content'] = content_df['overview'] + ' ' + content_df['genres'] + ' ' + content_df['title'] + ' ' + content_df['tagline'] + ' ' + content_df['production_companies']
+    content_df['id'] = content_df['id'].astype(str)
+    content_df['genres'] = parse_column(content_df['genres'], parse_genres)
+
+    content_df['production_companies'] = parse_column(content_df['production_companies'], parse_production_companies)
+    content_df['content'] = content_df['overview'] + ' ' + content_df['genres'].str.join(', ') + ' ' + content_df['title'] + ' ' + content_df['tagline'] + ' ' + content_df['production_companies'].str.join(', ')
 
 
 
@@ -0,0 +1,121 @@
+from concurrent.futures import ProcessPoolExecutor
+from util.similarity import SimilarityEngine
+import scipy.sparse as sp
+import numpy as np
+import json
+
+#Everything a worker needs to score and rerank seeds, set once by _init_worker
+_worker_state = None
+
+
+def _init_worker(movie_factors, title_codes, deleted, vote_average, popularity, rank_weights, k, num):
+    global _worker_state
+    _worker_state = (SimilarityEngine(movie_factors), title_codes, deleted, vote_average, popularity, rank_weights, k, num)
+
+
+#Score one block of seeds: mean similarity of the num best candidates (what GetScore has always
+#reported), the reranked list the API would serve, and that list's intra-list diversity
+def _evaluate_block(seeds, chunk_size=256):
+    engine, title_codes, deleted, vote_average, popularity, rank_weights, k, num = _worker_state
+    matches = engine.query_batch(seeds, 2 * k if deleted.any() else k, chunk_size)
+    indices = np.array([idx for idx, _ in matches], dtype=np.int64).reshape(len(seeds), -1)
+    scores = np.array([score for _, score in matches], dtype=np.float64).reshape(len(seeds), -1)
+    #Tombstoned candidates beyond the first k live ones and those sharing the seed's title are
+    #dropped, as remove_deleted and remove_same_title do
+    live = ~deleted[indices]
+    live &= np.cumsum(live, axis=1) <= k
+    keep = live & (title_codes[indices] != title_codes[np.asarray(seeds)][:, None])
+
+    #Candidates come sorted by similarity, so the num best kept ones are the first num kept ones
+    best = keep & (np.cumsum(keep, axis=1) <= num)
+    kept = best.sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        top_scores = np.where(best, scores, 0).sum(axis=1) / kept
+
+    #Same ranking as TopRecommendationRows, with dropped candidates sorted last
+    vote_weight, popularity_weight, similarity_weight = rank_weights
+    rank = np.where(keep, vote_weight * vote_average[indices] + popularity_weight * popularity[indices] + similarity_weight * scores, -np.inf)
+    order = np.argsort(-rank, axis=1, kind="stable")[:, :num]
+    served = np.take_along_axis(indices, order, axis=1)
+    served[~np.take_along_axis(keep, order, axis=1)] = -1
+
+    #Summed pairwise cosine of a list: |sum of its rows|^2 minus the rows' own squared lengths (1, or 0 if empty)
+    valid = served >= 0
+    lists = sp.csr_matrix((np.ones(valid.sum()), (np.nonzero(valid)[0], served[valid])), shape=(len(seeds), len(engine)))
+    sums = lists @ engine.factors
+    lengths = np.asarray((lists @ engine.factors.multiply(engine.factors)).sum(axis=1)).ravel()
+    sizes = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        diversity = np.where(sizes > 1, 1 - (np.asarray(sums.multiply(sums).sum(axis=1)).ravel() - lengths) / (sizes * (sizes - 1)), np.nan)
+    return top_scores, served, diversity
+
+
+#Seeds for one sample size; matches data.sample(n=n, random_state=seed), the sampling GetScore used
+def sample_rows(n_rows, n, seed=42):
+    if n >= n_rows:
+        return np.arange(n_rows)
+    return np.random.RandomState(seed).choice(n_rows, size=n, replace=False)
+
+
+#Offline evaluation of a model over one or more sample sizes (n >= catalog size means every movie).
+#Each distinct seed is scored once, in blocked batches spread over a process pool. rank_weights are the
+#served ranking's (recommender.RANK_WEIGHTS), so the lists evaluated are the lists served.
+def evaluate(model, sample_sizes, rank_weights, k=10, num=5, block_size=2048, workers=None, seed=42):
+    data = model.data
+    n_rows = len(data)
+    vote_average = data.vote_average
+    popularity = data.popularity
+    initargs = (model.factors, model.titles.codes, model.deleted, vote_average, popularity, rank_weights, k, num)
+
+    #Seeds are drawn from the live (not tombstoned) rows
+    live = np.flatnonzero(~model.deleted)
+    samples = [live[sample_rows(len(live), n, seed)] for n in sample_sizes]
+    seeds = np.unique(np.concatenate(samples)) if samples else np.empty(0, dtype=np.int64)
+    blocks = [seeds[start:start + block_size] for start in range(0, len(seeds), block_size)]
+    if workers == 1 or len(blocks) <= 1:
+        _init_worker(*initargs)
+        results = [_evaluate_block(block) for block in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(_evaluate_block, blocks))
+    top_scores = np.concatenate([r[0] for r in results]) if results else np.empty(0)
+    served = np.concatenate([r[1] for r in results]) if results else np.empty((0, num), dtype=np.int64)
+    diversity = np.concatenate([r[2] for r in results]) if results else np.empty(0)
+
+    #Popularity percentile of every movie within the catalog (0 = least, 1 = most popular)
+    percentile = np.zeros(n_rows)
+    percentile[live[np.argsort(popularity[live], kind="stable")]] = np.arange(len(live)) / max(len(live) - 1, 1)
+
+    report = []
+    for n, sample in zip(sample_sizes, samples):
+        positions = np.searchsorted(seeds, sample)
+        recommended = served[positions]
+        recommended = recommended[recommended >= 0]
+        report.append({
+            "sample_size": int(n),
+            "mean_similarity": float(np.nanmean(top_scores[positions])) if len(sample) else float("nan"),
+            #share of the catalog that appears in at least one served list
+            "coverage": float(len(np.unique(recommended)) / len(live)) if len(live) else 0.0,
+            #1 - mean pairwise cosine similarity inside a served list
+            "intra_list_diversity": float(np.nanmean(diversity[positions])) if len(sample) else float("nan"),
+            #0.5 when recommendations are as popular as the catalog at large, towards 1 when biased to hits
+            "popularity_percentile": float(percentile[recommended].mean()) if len(recommended) else float("nan"),
+            "popularity_lift": float(popularity[recommended].mean() / popularity[live].mean()) if len(recommended) and popularity[live].mean() else float("nan"),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    #Evaluate the CURRENT model bundle; sizes larger than the catalog evaluate every movie
+    import argparse
+    import time
+    from util import recommender, bundle
+    parser = argparse.ArgumentParser(description="Offline evaluation of the current model")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10 ** 9])
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    model = recommender.load_model(bundle.current_version())
+    start = time.perf_counter()
+    results = evaluate(model, args.sizes, recommender.RANK_WEIGHTS, workers=args.workers)
+    print(json.dumps({"version": model.version, "seconds": round(time.perf_counter() - start, 2), "results": results}, indent=2))
@@ -0,0 +1,61 @@
+import numpy as np
+import copy
+
+
+#Catalog ids come back from pandas and Mongo as int, float or str; compare them in one form
+def movie_key(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+#Maps catalog rows to Mongo _ids once, then loads any set of rows with a single $in query
+class MovieHydrator:
+    def __init__(self, collection, data):
+        self.collection = collection
+        ids = {}
+        for doc in collection.find({}, {"_id": 1, "id": 1}):
+            ids.setdefault(movie_key(doc.get("id")), doc["_id"])
+        #row index -> Mongo _id (None when the movie is not in the database)
+        self.row_ids = np.array([ids.get(movie_key(i)) for i in data.ids], dtype=object)
+        #Mongo _id -> row index, the reverse mapping
+        self.row_of = {movie_id: row for row, movie_id in enumerate(self.row_ids) if movie_id is not None}
+
+    #Copy of the mapping for data, this mapping's catalog with rows appended (looked up in one query by
+    #movie id), with deleted_rows no longer reachable from their _id
+    def appended(self, data, deleted_rows=()):
+        hydrator = copy.copy(self)
+        keys = [movie_key(data.ids[row]) for row in range(len(self.row_ids), len(data))]
+        ids = {}
+        if keys:
+            #ids are strings when loaded by initdb, but may be numbers in older databases
+            wanted = keys + [int(key) for key in keys if key.isdigit()]
+            for doc in self.collection.find({"id": {"$in": wanted}}, {"_id": 1, "id": 1}):
+                ids.setdefault(movie_key(doc.get("id")), doc["_id"])
+        new_ids = np.empty(len(keys), dtype=object)
+        new_ids[:] = [ids.get(key) for key in keys]
+        hydrator.row_ids = np.concatenate([self.row_ids, new_ids])
+        hydrator.row_of = dict(self.row_of)
+        for row in deleted_rows:
+            if hydrator.row_of.get(self.row_ids[row]) == row:
+                del hydrator.row_of[self.row_ids[row]]
+        for row, movie_id in enumerate(new_ids, start=len(self.row_ids)):
+            if movie_id is not None:
+                hydrator.row_of[movie_id] = row
+        return hydrator
+
+    #Row indices for a list of Mongo _ids, skipping movies that are not in the catalog
+    def rows_for(self, movie_ids):
+        return [self.row_of[i] for i in movie_ids if i in self.row_of]
+
+    def ids(self, rows):
+        return list(self.row_ids[np.asarray(rows, dtype=np.int64)])
+
+    #Documents for the given rows, in row order (None for rows missing from the database)
+    def hydrate(self, rows, projection):
+        row_ids = self.ids(rows)
+        wanted = [i for i in row_ids if i is not None]
+        docs = {}
+        if wanted:
+            docs = {doc["_id"]: doc for doc in self.collection.find({"_id": {"$in": wanted}}, projection)}
+        return [docs.get(i) for i in row_ids]
@@ -0,0 +1,210 @@
+from pymongo import UpdateOne
+from util.metrics import metrics
+import threading
+import time
+import os
+
+LIKE = 1
+DISLIKE = -1
+#Longest pause between retries of a failing flush, in seconds
+MAX_RETRY_DELAY = 5.0
+
+
+class QueueFull(Exception):
+    pass
+
+
+#Write-behind queue for likes and dislikes. Ratings are coalesced per (user, movie), the last one
+#winning, and written every flush_interval seconds as one unordered bulk_write with at most two
+#updates per user. At most max_pending ratings wait at a time: submit blocks up to submit_timeout for
+#a flush to make room, then raises QueueFull. A user never has two writes in flight, so they land in
+#the order they were made.
+#
+#pending() lets reads see a user's own unwritten ratings, but only those queued in this process:
+#another gunicorn worker sees a rating once it is flushed, normally within flush_interval. While
+#flushes fail and back off, submit writes the user's ratings itself instead of queueing them (raising
+#QueueFull if that fails too), so the window does not grow with the retry delay.
+class InteractionQueue:
+    def __init__(self, collection, max_pending=10000, flush_interval=0.05, submit_timeout=1.0):
+        self.collection = collection
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.submit_timeout = submit_timeout
+        #user id -> {movie id: 1 or -1}, waiting for the next flush
+        self.waiting = {}
+        self.n_waiting = 0
+        #user id -> the ratings being written for that user, still visible to pending() until the write returns
+        self.writing = {}
+        #consecutive failed flushes; submit writes directly while there are any
+        self.failures = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = None
+        self.pid = None
+        self.stats = {"events": 0, "coalesced": 0, "rejected": 0, "flushes": 0, "writes": 0, "write_errors": 0, "direct_writes": 0}
+
+    #Queue (movie id, 1 or -1) ratings of one user, in click order
+    def submit(self, user_id, events):
+        movie_ids = {movie_id for movie_id, _ in events}
+        deadline = time.monotonic() + self.submit_timeout
+        with self.condition:
+            if self.failures and not self.closed:
+                return self.submit_direct(user_id, events, deadline)
+            while True:
+                ratings = self.waiting.get(user_id, {})
+                added = len(movie_ids - ratings.keys())
+                if self.n_waiting + added <= self.max_pending:
+                    break
+                remaining = deadline - time.monotonic()
+                if self.closed or remaining <= 0 or added > self.max_pending:
+                    self.stats["rejected"] += len(events)
+                    raise QueueFull(f"{self.n_waiting} ratings waiting to be written")
+                #wake the flusher early, then wait for it to take the batch
+                self.condition.notify_all()
+                self.condition.wait(remaining)
+            if self.closed:
+                self.stats["rejected"] += len(events)
+                raise QueueFull("interaction queue is closed")
+            self.start_flusher()
+            ratings = self.waiting.setdefault(user_id, {})
+            for movie_id, value in events:
+                ratings[movie_id] = value
+            self.n_waiting += added
+            self.stats["events"] += len(events)
+            self.stats["coalesced"] += len(events) - added
+            if self.n_waiting >= self.max_pending // 2:
+                self.condition.notify_all()
+
+    #Write the user's queued ratings and events now, on the caller's thread (called holding the condition)
+    def submit_direct(self, user_id, events, deadline):
+        self.start_flusher()
+        while user_id in self.writing:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stats["rejected"] += len(events)
+                raise QueueFull("ratings of this user are still being written")
+            self.condition.wait(remaining)
+        ratings = self.waiting.pop(user_id, {})
+        self.n_waiting -= len(ratings)
+        for movie_id, value in events:
+            ratings[movie_id] = value
+        self.writing[user_id] = ratings
+        self.stats["events"] += len(events)
+        self.condition.release()
+        try:
+            self.write({user_id: ratings})
+            written = True
+        except Exception as e:
+            print("Direct interaction write failed:", e)
+            written = False
+        finally:
+            self.condition.acquire()
+        if written:
+            self.stats["direct_writes"] += 1
+            #the database is back: let the flusher retry now rather than after its backoff
+            self.failures = 0
+        else:
+            #kept for the flusher to retry, but the caller learns it is not saved yet
+            self.requeue({user_id: ratings})
+        del self.writing[user_id]
+        self.condition.notify_all()
+        if not written:
+            raise QueueFull("ratings could not be written")
+
+    #Ratings of a user not written yet, movie id -> 1 or -1. Read it BEFORE the user's document:
+    #a flush finishing in between is then still covered by this snapshot.
+    def pending(self, user_id):
+        with self.condition:
+            ratings = dict(self.writing.get(user_id, ()))
+            ratings.update(self.waiting.get(user_id, ()))
+        return ratings
+
+    #Started on first use in each process, so a queue created before a fork works in the workers, and
+    #again should the flusher ever have died
+    def start_flusher(self):
+        if self.pid != os.getpid() or not self.thread.is_alive():
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.run, name="interaction-flusher", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            with self.condition:
+                if self.failures:
+                    #back off while the database keeps failing; submit writes directly meanwhile
+                    self.condition.wait(min(self.flush_interval * 2 ** self.failures, MAX_RETRY_DELAY))
+                elif not self.closed and self.n_waiting < self.max_pending // 2:
+                    self.condition.wait(self.flush_interval)
+                #users with a write in flight stay queued for the next flush
+                batch = {user_id: ratings for user_id, ratings in self.waiting.items() if user_id not in self.writing}
+                self.waiting = {user_id: ratings for user_id, ratings in self.waiting.items() if user_id in self.writing}
+                self.n_waiting = sum(map(len, self.waiting.values()))
+                self.writing.update(batch)
+                closed = self.closed
+                self.condition.notify_all()
+            failed = False
+            try:
+                if batch:
+                    self.write(batch)
+            except Exception as e:
+                #the updates are idempotent, so the whole batch is retried, under any newer ratings
+                print("Interaction flush failed, retrying:", e)
+                failed = True
+                self.requeue(batch)
+            finally:
+                with self.condition:
+                    self.failures = self.failures + 1 if failed else 0
+                    for user_id in batch:
+                        del self.writing[user_id]
+                    self.condition.notify_all()
+                    done = closed and (not self.waiting or failed)
+                    if not batch and self.waiting and not done:
+                        #only users being written directly are waiting: give those writes time
+                        self.condition.wait(self.flush_interval)
+            if done:
+                return
+
+    def write(self, batch):
+        operations = []
+        for user_id, ratings in batch.items():
+            liked = [movie_id for movie_id, value in ratings.items() if value == LIKE]
+            disliked = [movie_id for movie_id, value in ratings.items() if value == DISLIKE]
+            #one update cannot both $addToSet and $pull the same array, so likes and dislikes go apart
+            if liked:
+                operations.append(UpdateOne({"_id": user_id}, {"$addToSet": {"likes": {"$each": liked}}, "$pull": {"dislikes": {"$in": liked}}}))
+            if disliked:
+                operations.append(UpdateOne({"_id": user_id}, {"$addToSet": {"dislikes": {"$each": disliked}}, "$pull": {"likes": {"$in": disliked}}}))
+        with metrics.span("interaction_flush"):
+            self.collection.bulk_write(operations, ordered=False)
+        with self.condition:
+            self.stats["flushes"] += 1
+            self.stats["writes"] += len(operations)
+
+    def requeue(self, batch):
+        with self.condition:
+            self.stats["write_errors"] += 1
+            for user_id, ratings in batch.items():
+                newer = self.waiting.get(user_id, {})
+                merged = {**ratings, **newer}
+                self.n_waiting += len(merged) - len(newer)
+                self.waiting[user_id] = merged
+
+    #Write everything queued and stop the flusher; later submits raise QueueFull
+    def close(self, timeout=10):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+            thread = self.thread if self.pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+        if self.waiting:
+            print(f"Interaction queue closed with {self.n_waiting} ratings unwritten")
+
+
+#Likes and dislikes (lists of movie ids, stored order) with a user's pending ratings applied on top
+def apply_pending(likes, dislikes, pending):
+    if not pending:
+        return list(likes), list(dislikes)
+    likes = [movie_id for movie_id in likes if movie_id not in pending] + [movie_id for movie_id, value in pending.items() if value == LIKE]
+    dislikes = [movie_id for movie_id in dislikes if movie_id not in pending] + [movie_id for movie_id, value in pending.items() if value == DISLIKE]
+    return likes, dislikes
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+#Thread-safe, bounded least-recently-used map
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.entries.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+#LRU whose entries also expire ttl seconds after they were stored
+class TTLCache(LRUCache):
+    def __init__(self, max_size, ttl):
+        super().__init__(max_size)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self.pop(key)
+            return default
+        return value
+
+    #ttl overrides the cache's default for this entry
+    def set(self, key, value, ttl=None):
+        super().set(key, (time.monotonic() + (self.ttl if ttl is None else ttl), value))
@@ -0,0 +1,142 @@
+from contextlib import nullcontext
+from contextvars import ContextVar
+import bisect
+import os
+import threading
+import time
+
+#Upper bounds (seconds) of the latency histogram buckets, from 0.1ms to 10s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "movierec_"
+
+#Stage timings of the current request, when it asked for a Server-Timing header
+current_trace = ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        #counts[i] observations fell in (buckets[i-1], buckets[i]]; the last slot is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+#In-process counters and latency histograms, rendered in the Prometheus text format. Each gunicorn
+#worker keeps its own; Prometheus sums the scrapes. Disabled, span() and count() cost one attribute check.
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        #(name, sorted label items) -> Histogram / number
+        self.histograms = {}
+        self.counters = {}
+        #callables returning (name, labels, value) counters owned by other objects
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def collect(self, collector):
+        self.collectors.append(collector)
+
+    #Time a block as one stage; the duration also goes into the request's trace, if any
+    def span(self, stage):
+        return Span(self, stage) if self.enabled else NULL_SPAN
+
+    def render(self):
+        counters = {}
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                counters.setdefault(name, []).append((dict(labels), value))
+            histograms = {}
+            for (name, labels), histogram in self.histograms.items():
+                histograms.setdefault(name, []).append((dict(labels), list(histogram.counts), histogram.sum, histogram.count))
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                counters.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            lines.extend(f"{PREFIX}{name}{format_labels(labels)} {value}" for labels, value in series)
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for labels, counts, total, count in series:
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{PREFIX}{name}_bucket{format_labels(dict(labels, le=bound))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe("stage_duration_seconds", elapsed, stage=self.stage)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.append((self.stage, elapsed))
+
+
+NULL_SPAN = nullcontext()
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+#Start collecting the stage timings of the current request; returns the list they are appended to
+def start_trace():
+    trace = []
+    current_trace.set(trace)
+    return trace
+
+
+def stop_trace():
+    current_trace.set(None)
+
+
+#Server-Timing header value for a trace, stages in the order they finished
+def server_timing(trace, total=None):
+    entries = [f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in trace]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+metrics = Metrics(enabled=os.environ.get("METRICS_ENABLED", "1") != "0")
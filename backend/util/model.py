@@ -0,0 +1,39 @@
+import numpy as np
+import threading
+
+
+#One immutable, loaded model version: catalog rows, factors, similarity backend and title index.
+#Requests take a reference once and use only it, so a swap never mixes two versions.
+#revision counts the catalog deltas applied on top of the bundle; deleted marks tombstoned rows.
+class Model:
+    def __init__(self, version, data, movie_factors, engine, titles, vocabulary, manifest, revision=0, deleted=None):
+        self.version = version
+        self.revision = revision
+        self.deleted = np.zeros(len(data), dtype=bool) if deleted is None else deleted
+        self.n_deleted = int(self.deleted.sum())
+        self.data = data
+        self.factors = movie_factors
+        self.engine = engine
+        self.titles = titles
+        self.vocabulary = vocabulary
+        self.manifest = manifest
+        self._derived = {}
+        self._lock = threading.RLock()
+
+    #Per-version state built from this model (hydrators, caches, ...), created once on first use
+    def derived(self, name, factory):
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = factory()
+            return self._derived[name]
+
+    def status(self):
+        return {
+            "version": self.version,
+            "revision": self.revision,
+            "created_at": self.manifest.get("created_at"),
+            "rows": len(self.data) - self.n_deleted,
+            "deleted": self.n_deleted,
+            "features": self.factors.shape[1],
+            "backend": type(self.engine).__name__,
+        }
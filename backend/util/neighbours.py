@@ -0,0 +1,117 @@
+from concurrent.futures import ProcessPoolExecutor
+from util.similarity import SimilarityEngine
+import scipy.sparse as sp
+import numpy as np
+import copy
+import os
+
+#Fixed binary layout: 16-byte header (magic, version, n_rows, k), then int32 indices[n_rows, k],
+#then float32 scores[n_rows, k]. Unused slots hold index -1.
+MAGIC = b"MRNB"
+VERSION = 1
+HEADER = np.dtype([("magic", "S4"), ("version", "<u4"), ("n_rows", "<u4"), ("k", "<u4")])
+
+#Exact engine of each worker process, set once by _init_worker
+_worker_engine = None
+
+
+def _init_worker(movie_factors):
+    global _worker_engine
+    _worker_engine = SimilarityEngine(movie_factors)
+
+
+def _neighbour_block(start, stop, k, chunk_size):
+    results = _worker_engine.query_batch(range(start, stop), k, chunk_size)
+    indices = np.full((stop - start, k), -1, dtype=np.int32)
+    scores = np.zeros((stop - start, k), dtype=np.float32)
+    for row, (idx, score) in enumerate(results):
+        indices[row, :len(idx)] = idx
+        scores[row, :len(score)] = score
+    return start, indices, scores
+
+
+#Precompute the top-k neighbours of every row across a process pool and write them to path
+def build_neighbour_table(movie_factors, path, k=50, block_size=4096, chunk_size=256, workers=None):
+    movie_factors = sp.csr_matrix(movie_factors, dtype=np.float32)
+    n_rows = movie_factors.shape[0]
+    #per process: workers that find the table missing at the same time each build their own copy
+    tmp_path = path + f".tmp{os.getpid()}"
+
+    try:
+        header = np.array([(MAGIC, VERSION, n_rows, k)], dtype=HEADER)
+        with open(tmp_path, "wb") as f:
+            header.tofile(f)
+            f.truncate(HEADER.itemsize + n_rows * k * 8)
+        indices = np.memmap(tmp_path, dtype=np.int32, mode="r+", offset=HEADER.itemsize, shape=(n_rows, k))
+        scores = np.memmap(tmp_path, dtype=np.float32, mode="r+", offset=HEADER.itemsize + n_rows * k * 4, shape=(n_rows, k))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(movie_factors,)) as pool:
+            blocks = [pool.submit(_neighbour_block, start, min(start + block_size, n_rows), k, chunk_size)
+                      for start in range(0, n_rows, block_size)]
+            for block in blocks:
+                start, block_indices, block_scores = block.result()
+                indices[start:start + len(block_indices)] = block_indices
+                scores[start:start + len(block_scores)] = block_scores
+
+        indices.flush()
+        scores.flush()
+        del indices, scores
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    #Readers only ever see a complete table
+    os.replace(tmp_path, path)
+
+
+#Read-only, memory-mapped neighbour table; server processes share the same page-cache pages
+class NeighbourTable:
+    def __init__(self, path):
+        header = np.fromfile(path, dtype=HEADER, count=1)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} neighbour table")
+        n_rows, k = int(header["n_rows"]), int(header["k"])
+        self.k = k
+        self.indices = np.memmap(path, dtype=np.int32, mode="r", offset=HEADER.itemsize, shape=(n_rows, k))
+        self.scores = np.memmap(path, dtype=np.float32, mode="r", offset=HEADER.itemsize + n_rows * k * 4, shape=(n_rows, k))
+        #Neighbours of rows appended after the table was written, kept in memory until it is rebuilt
+        self.extra_indices = np.empty((0, k), dtype=np.int32)
+        self.extra_scores = np.empty((0, k), dtype=np.float32)
+
+    def __len__(self):
+        return self.indices.shape[0] + self.extra_indices.shape[0]
+
+    #Exact neighbours of the new rows (past len(self)) of a grown factor matrix. Rows already in the
+    #table keep their stored lists, so they only see the new movies once the table is rebuilt.
+    def appended(self, movie_factors):
+        table = copy.copy(self)
+        engine = SimilarityEngine(sp.csr_matrix(movie_factors, dtype=np.float32, copy=True))
+        indices = np.full((len(engine) - len(self), self.k), -1, dtype=np.int32)
+        scores = np.zeros(indices.shape, dtype=np.float32)
+        for row, (idx, score) in enumerate(engine.query_batch(range(len(self), len(engine)), self.k)):
+            indices[row, :len(idx)] = idx
+            scores[row, :len(score)] = score
+        table.extra_indices = np.concatenate([self.extra_indices, indices])
+        table.extra_scores = np.concatenate([self.extra_scores, scores])
+        return table
+
+    #O(1) row read with the same contract as SimilarityEngine.query (at most self.k results)
+    def query(self, movie_idx, k):
+        indices, scores = self.indices, self.scores
+        if movie_idx >= indices.shape[0]:
+            indices, scores = self.extra_indices, self.extra_scores
+            movie_idx -= self.indices.shape[0]
+        found = np.asarray(indices[movie_idx, :k], dtype=np.int64)
+        valid = found >= 0
+        return found[valid], np.asarray(scores[movie_idx, :k])[valid]
+
+    def query_batch(self, movie_indices, k, chunk_size=256):
+        return [self.query(movie_idx, k) for movie_idx in movie_indices]
+
+
+if __name__ == "__main__":
+    #Rebuild the table of the CURRENT model bundle
+    from util import recommender, bundle
+    directory = bundle.bundle_path(bundle.current_version())
+    build_neighbour_table(sp.load_npz(os.path.join(directory, bundle.FACTORS_FILE)),
+                          os.path.join(directory, recommender.NEIGHBOUR_FILE), k=recommender.NEIGHBOUR_K)
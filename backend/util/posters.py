@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from requests.adapters import HTTPAdapter
+from pymongo import UpdateOne
+from util.lru import TTLCache
+from util.metrics import metrics
+import threading
+import requests
+
+TMDB_API_BASE = "https://api.themoviedb.org/3"
+TMDB_IMAGE_BASE = "https://image.tmdb.org/t/p/w185"
+
+
+#Marks a cached "TMDB has no poster for this id" so it is not fetched again until it expires
+_MISSING = object()
+
+
+#Resolves IMDb ids to poster URLs through an in-memory LRU, a persistent Mongo cache and a pooled
+#TMDB session; cache misses are fetched concurrently on a bounded thread pool. Both caches expire
+#posters after ttl and "no poster" answers after negative_ttl.
+class PosterResolver:
+    def __init__(self, api_key, collection=None, api_base=TMDB_API_BASE, max_entries=10000,
+                 ttl=timedelta(days=30), negative_ttl=timedelta(days=1), workers=8, timeout=5):
+        self.api_key = api_key
+        self.collection = collection
+        self.api_base = api_base.rstrip('/')
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.memory = TTLCache(max_entries, ttl.total_seconds())
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tmdb")
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=workers, pool_maxsize=workers))
+        self.session.mount("http://", HTTPAdapter(pool_connections=workers, pool_maxsize=workers))
+        self.stats = {"memory_hits": 0, "store_hits": 0, "fetches": 0, "fetch_errors": 0}
+        self.stats_lock = threading.Lock()
+        if collection is not None:
+            #Mongo drops expired entries by itself
+            collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def count(self, name, amount=1):
+        with self.stats_lock:
+            self.stats[name] += amount
+
+    #Poster URL for one IMDb id, or None
+    def get(self, imdb_id):
+        return self.resolve_many([imdb_id])[0]
+
+    #Poster URLs (or None) for a list of IMDb ids, in the same order
+    def resolve_many(self, imdb_ids):
+        if not self.api_key:
+            return [None] * len(imdb_ids)
+        found = {}
+        pending = []
+        for imdb_id in dict.fromkeys(i for i in imdb_ids if i):
+            cached = self.memory.get(imdb_id)
+            if cached is None:
+                pending.append(imdb_id)
+            else:
+                found[imdb_id] = cached
+        self.count("memory_hits", len(found))
+
+        if pending and self.collection is not None:
+            now = datetime.now(timezone.utc)
+            stored = self.collection.find({"_id": {"$in": pending}, "expires_at": {"$gt": now}}, {"poster": 1, "expires_at": 1})
+            for doc in stored:
+                found[doc["_id"]] = doc["poster"] or _MISSING
+                #kept in memory only as long as the stored entry is still valid
+                expires_at = doc["expires_at"]
+                if expires_at.tzinfo is None:
+                    expires_at = expires_at.replace(tzinfo=timezone.utc)
+                self.memory.set(doc["_id"], found[doc["_id"]], (expires_at - now).total_seconds())
+                self.count("store_hits")
+            pending = [i for i in pending if i not in found]
+
+        fetched = dict(zip(pending, self.pool.map(self.fetch, pending)))
+        #Transient failures come back as False and are not cached
+        fetched = {imdb_id: poster for imdb_id, poster in fetched.items() if poster is not False}
+        for imdb_id, poster in fetched.items():
+            found[imdb_id] = poster or _MISSING
+        self.remember(fetched)
+
+        return [None if found.get(i, _MISSING) is _MISSING else found[i] for i in imdb_ids]
+
+    #Store fresh lookups in memory and, in one unordered bulk write, in the persistent cache
+    def remember(self, posters):
+        for imdb_id, poster in posters.items():
+            self.memory.set(imdb_id, poster or _MISSING, (self.ttl if poster else self.negative_ttl).total_seconds())
+        if self.collection is not None and posters:
+            now = datetime.now(timezone.utc)
+            self.collection.bulk_write([
+                UpdateOne({"_id": imdb_id}, {"$set": {"poster": poster, "expires_at": now + (self.ttl if poster else self.negative_ttl)}}, upsert=True)
+                for imdb_id, poster in posters.items()
+            ], ordered=False)
+
+    #Ask TMDB for a poster: URL, None when TMDB has none, False when the request failed
+    def fetch(self, imdb_id):
+        self.count("fetches")
+        try:
+            url = f"{self.api_base}/find/{imdb_id}"
+            params = {"api_key": self.api_key, "external_source": "imdb_id"}
+            with metrics.span("tmdb_fetch"):
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            if data.get("movie_results"):
+                poster_path = data["movie_results"][0].get("poster_path")
+                if poster_path:
+                    return poster_url(poster_path)
+            return None
+        except Exception as e:
+            self.count("fetch_errors")
+            metrics.count("external_call_failures_total", service="tmdb")
+            print("TMDB fetch error:", e)
+            return False
+
+
+def poster_url(poster_path):
+    return f"{TMDB_IMAGE_BASE.rstrip('/')}/{poster_path.lstrip('/')}"
@@ -0,0 +1,103 @@
+from util.lru import TTLCache
+from util.metrics import metrics
+import numpy as np
+import threading
+
+
+#A user's taste vector: the sum of liked rows minus dislike_weight times the disliked rows
+class Profile:
+    def __init__(self, n_features):
+        self.vector = np.zeros(n_features, dtype=np.float32)
+        #row index -> 1 (liked) or -1 (disliked)
+        self.ratings = {}
+
+    def copy(self):
+        profile = Profile(0)
+        profile.vector = self.vector.copy()
+        profile.ratings = dict(self.ratings)
+        return profile
+
+    def rated_rows(self):
+        return np.fromiter(self.ratings.keys(), dtype=np.int64, count=len(self.ratings))
+
+
+#Cached per-user profiles over one model's L2-normalized factor rows. A like or dislike only
+#adds or subtracts that one sparse row, so the cost never depends on the size of the history.
+#Every worker process has its own cache and only sees the ratings it served, so profiles expire
+#after ttl seconds and are rebuilt from the database, which bounds how stale another worker can be.
+class ProfileStore:
+    def __init__(self, normalized_factors, max_users=2000, dislike_weight=0.5, ttl=30):
+        self.factors = normalized_factors
+        self.dislike_weight = dislike_weight
+        self.profiles = TTLCache(max_users, ttl)
+        self.lock = threading.Lock()
+        #user id -> logs of the ratings made while that user's profile is being rebuilt
+        self.rebuilding = {}
+
+    def weight(self, value):
+        return {1: 1.0, -1: -self.dislike_weight}.get(value, 0.0)
+
+    def apply(self, profile, row, value):
+        old = profile.ratings.get(row, 0)
+        if old == value:
+            return
+        factor_row = self.factors[row]
+        profile.vector[factor_row.indices] += (self.weight(value) - self.weight(old)) * factor_row.data
+        if value:
+            profile.ratings[row] = value
+        else:
+            profile.ratings.pop(row, None)
+
+    #Cached profile, or one built from load() -> (liked rows, disliked rows) on a cache miss
+    def get(self, user_id, load):
+        profile = self.profiles.get(user_id)
+        metrics.count("cache_requests_total", cache="profile", result="miss" if profile is None else "hit")
+        if profile is None:
+            log = []
+            with self.lock:
+                self.rebuilding.setdefault(user_id, []).append(log)
+            try:
+                liked_rows, disliked_rows = load()
+                profile = Profile(self.factors.shape[1])
+                for row in liked_rows:
+                    self.apply(profile, row, 1)
+                for row in disliked_rows:
+                    self.apply(profile, row, -1)
+            except BaseException:
+                with self.lock:
+                    self.end_rebuild(user_id, log)
+                raise
+            with self.lock:
+                self.end_rebuild(user_id, log)
+                #ratings made during load() may be missing from what it read; they are newer
+                for row, value in log:
+                    self.apply(profile, row, value)
+                self.profiles.set(user_id, profile)
+        return profile
+
+    #Private copy of the profile get() returns, taken under the lock so that a concurrent rate() is
+    #either wholly in it or not at all; scoring reads the copy
+    def snapshot(self, user_id, load):
+        profile = self.get(user_id, load)
+        with self.lock:
+            return profile.copy()
+
+    def end_rebuild(self, user_id, log):
+        logs = [other for other in self.rebuilding[user_id] if other is not log]
+        if logs:
+            self.rebuilding[user_id] = logs
+        else:
+            del self.rebuilding[user_id]
+
+    #Record a like (1) or dislike (-1) on a cached profile (or one being rebuilt); other users are
+    #rebuilt on their next get
+    def rate(self, user_id, row, value):
+        with self.lock:
+            profile = self.profiles.get(user_id)
+            if profile is not None:
+                self.apply(profile, row, value)
+            for log in self.rebuilding.get(user_id, ()):
+                log.append((row, value))
+
+    def forget(self, user_id):
+        self.profiles.pop(user_id)
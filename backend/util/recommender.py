@@ -1,105 +1,401 @@
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import MultiLabelBinarizer
-from sklearn.metrics.pairwise import cosine_similarity
-from util import csvParser
-import torch
+from util import csvParser, bundle, evaluation, updates
+from util.similarity import SimilarityEngine, top_k
+from util.ann import IVFIndex
+from util.neighbours import NeighbourTable, build_neighbour_table
+from util.titles import TitleIndex, normalize_title
+from util.model import Model
+from util.catalog import Catalog
+from util.profiles import ProfileStore
+from util.results import ResultCache, MISSING
+from util.metrics import metrics
+import scipy.sparse as sp
+import numpy as np
+import threading
+import time
+import os
+
+#Sparse factors make a wide vocabulary cheap, so this can go well past 500
+MAX_FEATURES = int(os.environ.get("TFIDF_MAX_FEATURES", 5000))
+
+#"exact" scores the whole catalog, "ivf" only the IVF_PROBE closest of IVF_LISTS clusters (0 = sqrt(n)),
+#"table" reads the top NEIGHBOUR_K rows precomputed into the model bundle from a memory-mapped file
+SIMILARITY_BACKEND = os.environ.get("SIMILARITY_BACKEND", "exact")
+IVF_LISTS = int(os.environ.get("IVF_LISTS", 0))
+IVF_PROBE = int(os.environ.get("IVF_PROBE", 8))
+NEIGHBOUR_FILE = "neighbours.bin"
+NEIGHBOUR_K = int(os.environ.get("NEIGHBOUR_K", 50))
+
+#Finished recommendations kept per model version (0 disables the cache), and how many of the most
+#popular titles are precomputed in the background when a model is loaded
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 5000))
+RESULT_WARMUP_TITLES = int(os.environ.get("RESULT_WARMUP_TITLES", 500))
+#Seconds a cached user profile is trusted: each worker only sees the ratings it served itself
+PROFILE_TTL = float(os.environ.get("PROFILE_TTL", 30))
+#Weights of vote_average, popularity and similarity in the final ranking
+RANK_WEIGHTS = (0.15, 0.15, 0.7)
+
+#A model is compacted once this many catalog deltas or this share of tombstoned rows piled up
+COMPACT_DELTAS = int(os.environ.get("CATALOG_COMPACT_DELTAS", 20))
+COMPACT_DELETED_RATIO = float(os.environ.get("CATALOG_COMPACT_DELETED_RATIO", 0.1))
+
+#The model serving requests; replaced as a whole by activate_model, never modified in place
+Active_model = None
+Model_lock = threading.Lock()
+#Serializes catalog updates, catch-ups and compactions, which all derive from the active model
+Update_lock = threading.Lock()
 
 
 #Process the data to appropriate format
-def Recommender(Movie_idx, movie_factors, number, data):
-    
-    # Compute cosine similarity
-    similarities = cosine_similarity(movie_factors[Movie_idx].unsqueeze(0), movie_factors).flatten()
-
-    # Sort by similarity score in descending order
-    rec_indices = similarities.argsort()[::-1][1:number+1]  
-    #remove the original title
-    rec_indices = [idx for idx in rec_indices if data.iloc[idx]['title'] != data.iloc[Movie_idx]['title']]
-    
-    # Get corresponding similarity scores
-    rec_scores = similarities[rec_indices]
-    return rec_indices, rec_scores
-
-#Process data to Pytorch Format
+def Recommender(Movie_idx, model, number):
+
+    # Top matches by cosine similarity, partial selection instead of a full sort
+    with metrics.span("similarity"):
+        rec_indices, similarities = model.engine.query(Movie_idx, candidate_count(model, number))
+    rec_indices, similarities = remove_deleted(model, rec_indices, similarities, number)
+    return remove_same_title(model.titles, Movie_idx, rec_indices, similarities)
+
+#Candidates to ask the engine for: some spare ones once tombstoned rows may take up places
+def candidate_count(model, number):
+    return 2 * number if model.n_deleted else number
+
+#drop tombstoned rows (deleted or replaced by a catalog update) from a candidate list
+def remove_deleted(model, rec_indices, rec_scores, number):
+    if model.n_deleted:
+        keep = ~model.deleted[rec_indices]
+        rec_indices, rec_scores = rec_indices[keep], rec_scores[keep]
+    return rec_indices[:number], rec_scores[:number]
+
+#remove the original title (and its duplicates) from a candidate list
+def remove_same_title(titles, Movie_idx, rec_indices, rec_scores):
+    keep = titles.different_title(Movie_idx, rec_indices)
+    return rec_indices[keep], rec_scores[keep]
+
+#Return the active model, loading the CURRENT bundle (or building one) on first use
+def get_model():
+    if Active_model is None:
+        with Model_lock:
+            version = bundle.current_version()
+            model = load_model(version) if version and Active_model is None else None
+            if model is not None:
+                activate_model(model)
+    return Active_model or initdata()
+
+#Make a model the active one; requests already holding the previous model finish on it. With
+#`replacing`, CURRENT is only moved while it still names that version (FileExistsError otherwise), so a
+#process working from a stale model never takes CURRENT away from a newer one.
+def activate_model(model, replacing=None):
+    global Active_model
+    if replacing is None:
+        bundle.set_current(model.version)
+    elif not bundle.replace_current(replacing, model.version):
+        raise FileExistsError(f"CURRENT no longer names model {replacing}")
+    previous, Active_model = Active_model, model
+    return previous
+
+#Load a bundle from disk, build its similarity backend and title index, then apply its catalog deltas
+def load_model(version):
+    with metrics.span("model_load"):
+        loaded = bundle.load(version)
+        if loaded is None:
+            return None
+        data, movie_factors, vocabulary, manifest = loaded
+        engine = build_engine(movie_factors, bundle.bundle_path(version))
+        model = Model(version, data, movie_factors, engine, TitleIndex(data), vocabulary, manifest)
+        for delta in bundle.load_deltas(version):
+            model = updates.apply_delta(model, *delta)
+    return model
+
+#Build the configured similarity backend from a factor matrix
+def build_engine(movie_factors, directory):
+    if SIMILARITY_BACKEND == "table":
+        neighbour_file = os.path.join(directory, NEIGHBOUR_FILE)
+        if not os.path.exists(neighbour_file):
+            build_neighbour_table(movie_factors, neighbour_file, k=NEIGHBOUR_K)
+        return NeighbourTable(neighbour_file)
+    if SIMILARITY_BACKEND == "ivf":
+        return IVFIndex(movie_factors, n_lists=IVF_LISTS, n_probe=IVF_PROBE)
+    return SimilarityEngine(movie_factors)
+
+#Process data to a sparse (CSR) factor matrix
 def processData(data):
-    tfidf = TfidfVectorizer(max_features=500)
+    return buildFactors(data)[0]
+
+#Fit the encoders and build the factor matrix; also returns the fitted vocabularies
+def buildFactors(data):
+    tfidf = TfidfVectorizer(max_features=MAX_FEATURES, dtype=np.float32)
     #convert content describtion to numeric values
-    encoded_content = tfidf.fit_transform(data["content"]).toarray()
-    
-    #encoding genres and companies for ML purposes
-    encoded_genres = MultiLabelBinarizer().fit_transform(data['genres'])
-    encoded_companies = MultiLabelBinarizer().fit_transform(data['production_companies'])
-
-    #Change the all factors to pytorch format
-    genres = torch.tensor(encoded_genres, dtype=torch.float32)
-    companies = torch.tensor(encoded_companies, dtype=torch.float32)
-    content = torch.tensor(encoded_content, dtype=torch.float32)
-    movie_factors = torch.cat([genres, companies, content], dim=1)
-    return movie_factors
+    encoded_content = tfidf.fit_transform(data["content"])
+
+    #encoding genres and companies (lists of names) for ML purposes
+    genres = MultiLabelBinarizer(sparse_output=True)
+    companies = MultiLabelBinarizer(sparse_output=True)
+    encoded_genres = genres.fit_transform(data['genres'])
+    encoded_companies = companies.fit_transform(data['production_companies'])
+
+    #Stack all factors without ever densifying them
+    movie_factors = sp.hstack([encoded_genres, encoded_companies, encoded_content], format="csr", dtype=np.float32)
+    vocabulary = {
+        "genres": [str(c) for c in genres.classes_],
+        "production_companies": [str(c) for c in companies.classes_],
+        "tfidf": {
+            "max_features": MAX_FEATURES,
+            "vocabulary": {term: int(i) for term, i in tfidf.vocabulary_.items()},
+            "idf": tfidf.idf_.tolist(),
+        },
+    }
+    return movie_factors, vocabulary
 
 #Make top movie recommendations recommendations based on the vote average and popularity
 def TopRecommendations(data,recommendations,score,num):
-    #Find the corresponding movies
-    recommended_movies = data.iloc[recommendations].copy()
-    recommended_movies['Sim_Score'] = score
-    recommended_movies['Score'] = ((0.15*recommended_movies['vote_average']) + (0.15*recommended_movies['popularity']))+(0.7*recommended_movies["Sim_Score"])
+    return data.titles.take(TopRecommendationRows(data,recommendations,score,num))
 
-    recommendations = recommended_movies.sort_values(by='Score', ascending=False).head(num)['title'].to_numpy()
+#Same ranking as TopRecommendations, but returns the row indices of the chosen movies
+def TopRecommendationRows(data,recommendations,score,num):
+    with metrics.span("rerank"):
+        recommendations = np.asarray(recommendations, dtype=np.int64)
+        vote_weight, popularity_weight, similarity_weight = RANK_WEIGHTS
+        scores = ((vote_weight*data.vote_average[recommendations]) + (popularity_weight*data.popularity[recommendations]))+(similarity_weight*np.asarray(score, dtype=np.float64))
 
-    return recommendations
+        return recommendations[np.argsort(-scores, kind="stable")[:num]]
 
 #Make top movie recommendations recommendations based on the vote average and popularity
 def TopScore(data,recommendations,score,num):
-    #Find the corresponding movies
-    recommended_movies = data.iloc[recommendations].copy()
-    recommended_movies['Sim_Score'] = score
+    return np.sort(np.asarray(score, dtype=np.float64))[::-1][:num].mean()
 
-    recommendations = recommended_movies.sort_values(by='Sim_Score', ascending=False).head(num)['Sim_Score'].to_numpy()
-    avg_score = recommendations.mean()
-    return avg_score
-
-#Use to initialize the data and create Movie_factor.pt   
-def initdata():
+#Build (or reuse) the model bundle for the current CSV and return it loaded, without activating it
+def buildModel():
+    start = time.perf_counter()
+    #Reuse the parsed catalog and factors when the CSV, parser and settings are unchanged
+    version = bundle.bundle_version(csvParser.CSV_FILE_PATH, csvParser.PARSER_VERSION, MAX_FEATURES)
+    #A compaction of this bundle carries its catalog updates, so it takes precedence
+    descendant = bundle.compacted_descendant(version)
+    model = (descendant and load_model(descendant)) or load_model(version)
+    if model is not None:
+        print(f"Model {model.version} loaded in {time.perf_counter() - start:.2f}s")
+        return model
     #Obatin data by parsing csv file
     data = csvParser.ParseMovieData()
     #Parse movie data
-    movie_factors = processData(data)
-    # Save the precomputed movie_factors
-    torch.save(movie_factors, "Movie_factor.pt")
-    return data
+    movie_factors, vocabulary = buildFactors(data)
+    #Only the compact catalog is kept; the text columns are not needed once the factors exist
+    bundle.save(version, Catalog.from_frame(data), movie_factors, vocabulary, csv=csvParser.CSV_FILE_PATH,
+                parser_version=csvParser.PARSER_VERSION, max_features=MAX_FEATURES)
+    del data, movie_factors
+    model = load_model(version)
+    print(f"Model {version} built in {time.perf_counter() - start:.2f}s")
+    return model
+
+#Use to initialize the data: build or load the model bundle for the current CSV and make it the active
+#model. A version pinned by reload_model (a rollback, say) is kept instead while CURRENT still names it.
+def initdata():
+    start = time.perf_counter()
+    current = bundle.current_version()
+    model = current and current == bundle.pinned_version() and load_model(current)
+    if model:
+        print(f"Pinned model {model.version} loaded in {time.perf_counter() - start:.2f}s")
+    else:
+        model = buildModel()
+    activate_model(model)
+    return model
+
+#Load a new model next to the active one and swap it in atomically once it is ready;
+#prepare(model) can warm per-version state before the swap. An explicit version is pinned so that
+#restarts keep it; a reload without one rebuilds from the CSV and lifts the pin.
+def reload_model(version=None, prepare=None):
+    model = load_model(version) if version else buildModel()
+    if model is None:
+        raise ValueError(f"Model bundle {version} is missing or corrupt")
+    if prepare:
+        prepare(model)
+    if version:
+        bundle.pin(version)
+    else:
+        bundle.unpin()
+    activate_model(model)
+    return model
+
+#Add or replace movies (raw movies_metadata records) and tombstone deleted_ids on the active model,
+#against its frozen encoders: the cost follows the batch size, not the catalog size. The batch is
+#persisted as the bundle's next delta before the grown model is swapped in;
+#prepare(model, previous) can carry per-version state over first. Raises FileExistsError when another
+#process got there first: it added that delta, is compacting the bundle or activated another model.
+def update_catalog(movies=(), deleted_ids=(), prepare=None):
+    with Update_lock:
+        model = get_model()
+        data = updates.prepare_movies(model, movies)
+        movie_factors = updates.encoder(model).encode(data)
+        #an updated movie is its old row tombstoned plus a new row
+        tombstoned = list(deleted_ids) + list(data['id'])
+        catalog = Catalog.from_frame(data)
+        sequence = model.revision + 1
+        bundle.save_delta(model.version, sequence, catalog, movie_factors, tombstoned)
+        updated = updates.apply_delta(model, sequence, catalog, movie_factors, tombstoned)
+        if prepare:
+            prepare(updated, model)
+        activate_model(updated, replacing=model.version)
+        return updated
+
+#Apply the deltas another process added to the active model's bundle
+def catch_up(prepare=None):
+    with Update_lock:
+        model = previous = get_model()
+        for delta in bundle.load_deltas(model.version, after=model.revision):
+            model = updates.apply_delta(model, *delta)
+        if model is not previous:
+            if prepare:
+                prepare(model, previous)
+            activate_model(model, replacing=previous.version)
+        return model
+
+def needs_compaction(model):
+    return model.revision >= COMPACT_DELTAS or model.n_deleted > COMPACT_DELETED_RATIO * len(model.data)
+
+#Rewrite the active model without its tombstoned rows as a new bundle (no deltas) and activate it.
+#The frozen vocabulary is kept; updates wait until it is done. The base bundle is sealed first, so no
+#process can add a delta the compaction would miss: those added before are replayed, later ones are
+#refused with FileExistsError. A base that was already sealed, or a CURRENT that moved meanwhile,
+#fails the compaction the same way.
+def compact_model(prepare=None):
+    with Update_lock:
+        model = get_model()
+        if not bundle.seal(model.version):
+            raise FileExistsError(f"Model bundle {model.version} is already compacted")
+        pinned = bundle.pinned_version() == model.version
+        try:
+            for delta in bundle.load_deltas(model.version, after=model.revision):
+                model = updates.apply_delta(model, *delta)
+            live = np.flatnonzero(~model.deleted)
+            version = bundle.compacted_version(model.version, model.revision)
+            source = dict(model.manifest.get("source", {}))
+            source.setdefault("base_version", model.version)
+            bundle.save(version, model.data.subset(live), model.factors[live], model.vocabulary,
+                        **dict(source, compacted_from=model.version, revision=model.revision))
+            compacted = load_model(version)
+            if compacted is None:
+                raise ValueError(f"Compacted model bundle {version} is unreadable")
+            if prepare:
+                prepare(compacted)
+            #the compaction of a pinned version stays pinned; that of a CSV bundle is found through base_version
+            if pinned:
+                bundle.pin(version)
+            activate_model(compacted, replacing=model.version)
+        except BaseException:
+            if pinned:
+                bundle.pin(model.version)
+            bundle.unseal(model.version)
+            raise
+        return compacted
 
 #Make Movie recommednations
-def MakeRecommendation(data,movie_title):
-    movie_idx = title_idx_conversion(data,movie_title)
+def MakeRecommendation(model,movie_title,year=None):
+    rows = MakeRecommendationRows(model,movie_title,year)
+    if rows is None:
+        return None
+    return model.data.titles.take(rows)
+
+#Make Movie recommendations, returned as catalog row indices
+def MakeRecommendationRows(model,movie_title,year=None):
+    cache = result_cache(model)
+    key = result_key(movie_title, year)
+    rows = cache.lookup(key)
+    if rows is not MISSING:
+        return rows
+    movie_idx = title_idx_conversion(model,movie_title,year)
     if movie_idx == None:
         return None
-    # Later, we load the precomputed data and generate recommendations
-    precomputed_factors = torch.load("Movie_factor.pt",weights_only=True)
-    recommended_indices,sim_score = Recommender(Movie_idx=movie_idx, movie_factors=precomputed_factors, number=10, data=data)
-
-    recommended_movies = TopRecommendations(data,recommended_indices,sim_score,5)
-    
-    return recommended_movies
-
-#To get the average score of each sample size
-def GetScore(data,sample_size):
-    result = []
-    for n in sample_size:
-        sampled_data = data.sample(n=n, random_state=42).index.to_list()
-        total = 0
-        for sample_idx in sampled_data:
-            movie_idx = sample_idx
-            # Later, we load the precomputed data and generate recommendations
-            precomputed_factors = torch.load("Movie_factor.pt",weights_only=True)
-            recommended_indices,sim_score = Recommender(Movie_idx=movie_idx, movie_factors=precomputed_factors, number=10, data=data)
-
-            total += TopScore(data,recommended_indices,sim_score,5)
-        result.append(total/len(sampled_data))
-    
-    return result
-
-#Find the movie Title
-def title_idx_conversion(data, title):
-    indices = data.index[data['title'].str.lower() == title.lower()].tolist()
+    recommended_indices,sim_score = Recommender(Movie_idx=movie_idx, model=model, number=10)
+
+    rows = TopRecommendationRows(model.data,recommended_indices,sim_score,5)
+    cache.store(key, rows)
+    return rows
+
+#Per-version cache of finished recommendation rows
+def result_cache(model):
+    return model.derived("results", lambda: ResultCache(RESULT_CACHE_SIZE))
+
+#Everything a cached result depends on besides the model: the title as looked up, the year filter,
+#candidate and result counts and the ranking weights
+def result_key(movie_title, year=None, number=10, num=5):
+    return (normalize_title(movie_title), int(year) if year else 0, number, num, RANK_WEIGHTS)
+
+#Precompute the results of the most popular titles; already cached ones are skipped, and the
+#warm-up stops early once another model has been activated
+def warm_results(model, n=RESULT_WARMUP_TITLES, batch_size=256):
+    live = np.flatnonzero(~model.deleted)
+    popular = live[top_k(model.data.popularity[live], n)]
+    titles = list(dict.fromkeys(model.titles.titles.take(popular)))
+    warmed = 0
+    for start in range(0, len(titles), batch_size):
+        if Active_model is not None and Active_model is not model:
+            break
+        warmed += len(MakeBatchRecommendationRows(model, titles[start:start + batch_size], record=False))
+    return warmed
+
+#Make recommendations for many titles at once, scored together as one blocked GEMM
+def MakeBatchRecommendation(model,movie_titles):
+    return {title: None if rows is None else model.data.titles.take(rows) for title, rows in MakeBatchRecommendationRows(model,movie_titles).items()}
+
+#Batch recommendations, returned as catalog row indices per seed title (cached ones are reused)
+def MakeBatchRecommendationRows(model,movie_titles,record=True):
+    cache = result_cache(model)
+    results = {}
+    seeds = []
+    for title in movie_titles:
+        rows = cache.lookup(result_key(title), record)
+        if rows is not MISSING:
+            results[title] = rows
+            continue
+        movie_idx = title_idx_conversion(model,title)
+        if movie_idx == None:
+            results[title] = None
+        else:
+            seeds.append((title, movie_idx))
+
+    with metrics.span("similarity_batch"):
+        matches = model.engine.query_batch([idx for _, idx in seeds], candidate_count(model, 10))
+    for (title, movie_idx), (indices, scores) in zip(seeds, matches):
+        indices, scores = remove_deleted(model, indices, scores, 10)
+        indices, scores = remove_same_title(model.titles, movie_idx, indices, scores)
+        results[title] = TopRecommendationRows(model.data,indices,scores,5)
+        cache.store(result_key(title), results[title])
+
+    return results
+
+#To get the average score of each sample size (see util.evaluation for coverage, diversity and popularity bias)
+def GetScore(model,sample_size,workers=None):
+    return [result["mean_similarity"] for result in evaluation.evaluate(model, sample_size, RANK_WEIGHTS, workers=workers)]
+
+#L2-normalized factor rows of a model (the exact and IVF engines already hold them)
+def normalized_factors(model):
+    if isinstance(model.engine, SimilarityEngine):
+        return model.engine.factors
+    return model.derived("normalized_factors", lambda: SimilarityEngine(model.factors).factors)
+
+#Per-version cache of user taste profiles, maintained incrementally on every like/dislike
+def get_profiles(model):
+    return model.derived("profiles", lambda: ProfileStore(normalized_factors(model), ttl=PROFILE_TTL))
+
+#Personalized recommendations from a user profile: one pass over the catalog, rated movies excluded.
+#Pass a ProfileStore.snapshot, never a cached profile that concurrent ratings can change mid-read.
+def PersonalRecommendationRows(model,profile,number=10,num=5):
+    if not any(value > 0 for value in profile.ratings.values()):
+        return None
+    with metrics.span("personal_similarity"):
+        scores = normalized_factors(model) @ profile.vector
+        norm = np.linalg.norm(profile.vector)
+        if norm > 0:
+            scores /= norm
+        scores[profile.rated_rows()] = -np.inf
+        if model.n_deleted:
+            scores[model.deleted] = -np.inf
+        recommended_indices = top_k(scores, min(number, len(scores) - len(profile.ratings) - model.n_deleted))
+
+    return TopRecommendationRows(model.data,recommended_indices,scores[recommended_indices],num)
+
+#Find the movie Title (first match, optionally narrowed down by release year)
+def title_idx_conversion(model, title, year=None):
+    with metrics.span("title_lookup"):
+        indices = model.titles.find(title, year)
     return indices[0] if indices else None
-    
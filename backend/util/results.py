@@ -0,0 +1,52 @@
+from util.lru import LRUCache
+from util.metrics import metrics
+import threading
+import sys
+
+#Marks a key that is not cached (a cached value is never None)
+MISSING = object()
+
+
+#LRU of finished recommendation rows for one model version. A new model gets a new cache, so
+#entries never outlive the version (or catalog revision) they were computed on.
+class ResultCache(LRUCache):
+    def __init__(self, max_size):
+        super().__init__(max_size)
+        self.hits = 0
+        self.misses = 0
+        self.stats_lock = threading.Lock()
+
+    #Cached rows or MISSING; record=False keeps warm-up lookups out of the hit rate
+    def lookup(self, key, record=True):
+        value = self.get(key, MISSING)
+        if not record:
+            return value
+        metrics.count("cache_requests_total", cache="results", result="miss" if value is MISSING else "hit")
+        with self.stats_lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    #Results are shared between requests, so they are stored read-only
+    def store(self, key, rows):
+        rows.flags.writeable = False
+        self.set(key, rows)
+
+    #Approximate size of the cached keys and row arrays
+    def nbytes(self):
+        with self.lock:
+            entries = list(self.entries.items())
+        return sum(sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key) + rows.nbytes for key, rows in entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "bytes": self.nbytes(),
+        }
@@ -0,0 +1,166 @@
+from util.titles import normalize_title
+from util.similarity import top_k
+import numpy as np
+import bisect
+import copy
+
+#Match quality before the popularity bonus: the exact title, then titles it is a prefix of, then
+#fuzzy (trigram Dice similarity, 0-1) matches
+EXACT_MATCH = 3.0
+PREFIX_MATCH = 2.0
+#Fuzzy matches below this similarity are not returned
+MIN_SIMILARITY = 0.5
+#Weight of a title's popularity percentile, which orders matches of the same quality
+POPULARITY_WEIGHT = 0.25
+#Trigrams found in more titles than this share (and at least COMMON_GRAM_MIN_TITLES) hold most of the
+#postings; they score candidates found through rarer trigrams but never produce candidates themselves
+COMMON_GRAM_SHARE = 0.01
+COMMON_GRAM_MIN_TITLES = 1000
+#Titles with the most rare trigrams in common that are scored exactly per fuzzy query
+FUZZY_CANDIDATES = 2000
+
+
+#Padded character trigrams of each string as (string index, trigram code) pairs; code points take 21
+#bits, so a trigram fits in one int64
+def trigrams(keys):
+    padded = ["  " + key + " " for key in keys]
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    chars = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    windows = lengths - 2
+    owner = np.repeat(np.arange(len(padded)), windows)
+    #position of every window: its string's start plus its offset within the string
+    positions = np.arange(windows.sum()) + np.repeat(np.cumsum(lengths) - lengths - (np.cumsum(windows) - windows), windows)
+    return owner, (chars[positions] << 42) | (chars[positions + 1] << 21) | chars[positions + 2]
+
+
+#Sorted unique titles with a trigram inverted index (CSR: trigram -> title positions)
+class TrigramTable:
+    def __init__(self, keys, percentile):
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        #sorted, so every prefix match is one contiguous range
+        self.keys = [keys[i] for i in order]
+        self.percentile = np.asarray(percentile, dtype=np.float64)[order]
+
+        owner, codes = trigrams(self.keys)
+        self.grams, gram_ids = np.unique(codes, return_inverse=True)
+        #one posting per (trigram, title), sorted by trigram then title
+        n_keys = max(len(self.keys), 1)
+        postings = np.sort(gram_ids.astype(np.int64) * n_keys + owner)
+        postings = postings[np.concatenate([[True], postings[1:] != postings[:-1]])] if len(postings) else postings
+        self.indices = (postings % n_keys).astype(np.int32)
+        lengths = np.bincount(postings // n_keys, minlength=len(self.grams))
+        self.indptr = np.concatenate([[0], np.cumsum(lengths)])
+        self.common = lengths > max(COMMON_GRAM_SHARE * len(self.keys), COMMON_GRAM_MIN_TITLES)
+        self.gram_counts = np.bincount(self.indices, minlength=len(self.keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    #Title positions containing trigram number g, sorted
+    def postings(self, g):
+        return self.indices[self.indptr[g]:self.indptr[g + 1]]
+
+    #Scores of the (at most) limit best prefix and exact matches, as (score, key) pairs
+    def prefix_matches(self, query, limit):
+        lo = bisect.bisect_left(self.keys, query)
+        hi = bisect.bisect_left(self.keys, query + "\U0010ffff")
+        matches = []
+        #the exact title sorts first in the range and is always kept, however many more popular titles extend it
+        if lo < hi and self.keys[lo] == query:
+            matches.append((EXACT_MATCH + POPULARITY_WEIGHT * self.percentile[lo], query))
+            lo += 1
+        best = lo + top_k(self.percentile[lo:hi], limit - len(matches))
+        return matches + [(PREFIX_MATCH + POPULARITY_WEIGHT * self.percentile[i], self.keys[i]) for i in best]
+
+    #Scores of the (at most) limit best titles sharing enough trigrams with the query
+    def fuzzy_matches(self, query, limit):
+        _, codes = trigrams([query])
+        codes = np.unique(codes)
+        found = np.searchsorted(self.grams, codes)
+        found = found[(found < len(self.grams)) & (self.grams[np.minimum(found, len(self.grams) - 1)] == codes)]
+        rare, common = found[~self.common[found]], found[self.common[found]]
+        if not len(rare):
+            return []
+        overlap = np.bincount(np.concatenate([self.postings(g) for g in rare]), minlength=len(self.keys))
+        #Dice >= MIN_SIMILARITY needs at least this many shared trigrams, whatever the title's length
+        needed = MIN_SIMILARITY * len(codes) / (2 - MIN_SIMILARITY)
+        candidates = np.flatnonzero(overlap >= max(needed - len(common), 1))
+        if len(candidates) > FUZZY_CANDIDATES:
+            candidates = np.sort(candidates[np.argpartition(-overlap[candidates], FUZZY_CANDIDATES - 1)[:FUZZY_CANDIDATES]])
+        overlap = overlap[candidates]
+        for g in common:
+            posting = self.postings(g)
+            position = np.minimum(np.searchsorted(posting, candidates), len(posting) - 1)
+            overlap += posting[position] == candidates
+        similarity = 2 * overlap / (len(codes) + self.gram_counts[candidates])
+        keep = similarity >= MIN_SIMILARITY
+        candidates = candidates[keep]
+        scores = similarity[keep] + POPULARITY_WEIGHT * self.percentile[candidates]
+        best = top_k(scores, limit)
+        return [(scores[i], self.keys[candidates[i]]) for i in best]
+
+
+#Typo-tolerant autocomplete over a model's titles: prefix matches of the normalized query first, then
+#trigram matches (typos, words out of place), each ordered by popularity. Returns catalog rows.
+#Titles appended by catalog deltas go to a small second table until the next compaction.
+class TitleSearch:
+    def __init__(self, model):
+        self.titles = model.titles
+        self.popularity = model.data.popularity
+        keys = list(model.titles.rows)
+        popularity = np.array([self.popularity[rows].max() for rows in model.titles.rows.values()])
+        #popularity percentiles are measured against this distribution, appended titles included
+        self.reference = np.sort(popularity)
+        self.base = TrigramTable(keys, self.percentile(popularity))
+        self.base_rows = len(model.data)
+        self.extra = None
+
+    def percentile(self, popularity):
+        return np.searchsorted(self.reference, popularity, side="right") / max(len(self.reference), 1)
+
+    #Copy of the search for model, this search's model with catalog rows appended and/or tombstoned
+    def appended(self, model):
+        search = copy.copy(self)
+        search.titles = model.titles
+        search.popularity = model.data.popularity
+        keys = list(dict.fromkeys(normalize_title(model.data.titles[row]) for row in range(self.base_rows, len(model.data))))
+        keys = [key for key in keys if key in model.titles.rows]
+        popularity = np.array([search.popularity[model.titles.rows[key]].max() for key in keys])
+        search.extra = TrigramTable(keys, search.percentile(popularity)) if keys else None
+        return search
+
+    #Most popular live row carrying a normalized title, None once all of them are tombstoned
+    def row_of(self, key):
+        rows = self.titles.rows.get(key)
+        if not rows:
+            return None
+        return rows[int(np.argmax(self.popularity[rows]))]
+
+    #Up to limit catalog rows, best match first, one per distinct title
+    def search(self, query, limit=10):
+        query = normalize_title(query)
+        if not query:
+            return []
+        tables = [table for table in (self.base, self.extra) if table is not None]
+        #titles whose rows were all tombstoned are dropped at the end, so fetch a few spare ones
+        fetch = 2 * limit
+        matches = [match for table in tables for match in table.prefix_matches(query, fetch)]
+        if len(matches) < fetch and len(query) >= 3:
+            matches += [match for table in tables for match in table.fuzzy_matches(query, fetch)]
+
+        scores = {}
+        for score, key in matches:
+            scores[key] = max(score, scores.get(key, score))
+        rows = []
+        for key in sorted(scores, key=scores.get, reverse=True):
+            row = self.row_of(key)
+            if row is not None:
+                rows.append(row)
+                if len(rows) == limit:
+                    break
+        return rows
+
+
+#Per-version title search; a model grown by catalog deltas extends its predecessor's (see updates.apply_delta)
+def title_search(model):
+    return model.derived("title_search", lambda: TitleSearch(model))
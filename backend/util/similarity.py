@@ -0,0 +1,74 @@
+from sklearn.preprocessing import normalize
+import copy
+import scipy.sparse as sp
+import numpy as np
+
+
+#Long-lived cosine similarity engine over a sparse (CSR) factor matrix, built once and kept in memory
+class SimilarityEngine:
+    def __init__(self, movie_factors):
+        factors = sp.csr_matrix(movie_factors, dtype=np.float32)
+        #L2-normalize every row once so a dot product is the cosine similarity (empty rows stay zero)
+        self.factors = normalize(factors, norm="l2", copy=False)
+
+    def __len__(self):
+        return self.factors.shape[0]
+
+    #Copy of the engine over a grown factor matrix: rows past len(self) are new and only they are normalized
+    def appended(self, movie_factors):
+        new_rows = sp.csr_matrix(movie_factors[len(self):], dtype=np.float32, copy=True)
+        engine = copy.copy(self)
+        engine.factors = sp.vstack([self.factors, normalize(new_rows, norm="l2", copy=False)], format="csr")
+        return engine
+
+    #Dense copy of a few normalized rows, used as the right-hand side of a sparse product
+    def rows(self, movie_indices):
+        return self.factors[movie_indices].toarray()
+
+    #Cosine similarity of one movie against the whole catalog (single sparse mat-vec)
+    def scores(self, movie_idx):
+        return self.factors @ self.rows([movie_idx])[0]
+
+    #Indices and scores of the k most similar movies, excluding the movie itself
+    def query(self, movie_idx, k):
+        scores = self.scores(movie_idx)
+        scores[movie_idx] = -np.inf
+        indices = top_k(scores, min(k, len(self) - 1))
+        return indices, scores[indices]
+
+    #Top-k for many movies at once, scored as blocked mat-mat products so peak memory stays at chunk_size rows
+    def query_batch(self, movie_indices, k, chunk_size=256):
+        movie_indices = np.asarray(movie_indices, dtype=np.int64)
+        k = min(k, len(self) - 1)
+        results = []
+        for start in range(0, len(movie_indices), chunk_size):
+            chunk = movie_indices[start:start + chunk_size]
+            scores = np.ascontiguousarray((self.factors @ self.rows(chunk).T).T)
+            scores[np.arange(len(chunk)), chunk] = -np.inf
+            indices = top_k_rows(scores, k)
+            results.extend(zip(indices, np.take_along_axis(scores, indices, axis=1)))
+        return results
+
+
+#Partial selection of the k highest scores, returned in descending order
+def top_k(scores, k):
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+#Row-wise partial selection of the k highest scores of a 2-D score block
+def top_k_rows(scores, k):
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
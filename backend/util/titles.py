@@ -0,0 +1,59 @@
+import numpy as np
+import copy
+
+
+#Canonical form used for every title lookup: case-folded, trimmed, single-spaced
+def normalize_title(title):
+    return " ".join(str(title).casefold().split())
+
+
+#Hash index over the catalog titles, built once when the data is loaded
+class TitleIndex:
+    def __init__(self, data):
+        #row index -> title and release year (the catalog's own columns); years disambiguate duplicate titles
+        self.titles = data.titles
+        self.years = data.years
+        #row index -> hash of the normalized title, for vectorized comparisons without a string per row
+        #(a 64-bit collision between two distinct titles is not a practical concern)
+        self.codes = np.empty(len(data), dtype=np.int64)
+
+        #normalized title -> all row indices carrying it, in catalog order
+        self.rows = {}
+        for idx, title in enumerate(self.titles):
+            key = normalize_title(title)
+            self.codes[idx] = hash(key)
+            if key:
+                self.rows.setdefault(key, []).append(idx)
+
+    #Copy of the index for data, this index's catalog with rows appended, with deleted_rows no longer
+    #found by title; lists shared with this index are replaced, never modified
+    def appended(self, data, deleted_rows=()):
+        index = copy.copy(self)
+        start = len(self.titles)
+        index.titles = data.titles
+        index.years = data.years
+        normalized = [normalize_title(data.titles[idx]) for idx in range(start, len(data))]
+        index.codes = np.concatenate([self.codes, np.array([hash(key) for key in normalized], dtype=np.int64)])
+        index.rows = dict(self.rows)
+        for row in deleted_rows:
+            key = normalize_title(self.titles[row])
+            remaining = [idx for idx in index.rows.get(key, []) if idx != row]
+            if remaining:
+                index.rows[key] = remaining
+            else:
+                index.rows.pop(key, None)
+        for idx, key in enumerate(normalized, start=start):
+            if key:
+                index.rows[key] = index.rows.get(key, []) + [idx]
+        return index
+
+    #All rows matching a title, optionally only those released in a given year
+    def find(self, title, year=None):
+        candidates = self.rows.get(normalize_title(title), [])
+        if year:
+            candidates = [idx for idx in candidates if self.years[idx] == int(year)]
+        return candidates
+
+    #Boolean mask of candidates that do not share the seed row's title
+    def different_title(self, movie_idx, indices):
+        return self.codes[indices] != self.codes[movie_idx]
@@ -0,0 +1,86 @@
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import MultiLabelBinarizer
+from util import csvParser
+from util.hydration import movie_key
+from util.model import Model
+from util.search import title_search
+from util.similarity import SimilarityEngine
+import scipy.sparse as sp
+import pandas as pd
+import numpy as np
+import warnings
+
+
+#Encoders rebuilt from a bundle's vocabulary.json, never refitted: new movies get factor rows in the
+#bundle's exact column layout (genres | companies | TF-IDF). Unseen genres, companies and terms are dropped.
+class FactorEncoder:
+    def __init__(self, vocabulary):
+        self.genres = MultiLabelBinarizer(classes=vocabulary["genres"], sparse_output=True).fit([])
+        self.companies = MultiLabelBinarizer(classes=vocabulary["production_companies"], sparse_output=True).fit([])
+        tfidf = vocabulary["tfidf"]
+        self.tfidf = TfidfVectorizer(vocabulary=tfidf["vocabulary"], dtype=np.float32)
+        self.tfidf.idf_ = np.asarray(tfidf["idf"], dtype=np.float32)
+
+    def encode(self, data):
+        if not len(data):
+            width = len(self.genres.classes_) + len(self.companies.classes_) + len(self.tfidf.vocabulary)
+            return sp.csr_matrix((0, width), dtype=np.float32)
+        with warnings.catch_warnings():
+            #"unknown class(es) will be ignored" is exactly what a frozen binarizer should do
+            warnings.simplefilter("ignore", UserWarning)
+            encoded_genres = self.genres.transform(data['genres'])
+            encoded_companies = self.companies.transform(data['production_companies'])
+        encoded_content = self.tfidf.transform(data['content'])
+        return sp.hstack([encoded_genres, encoded_companies, encoded_content], format="csr", dtype=np.float32)
+
+
+def encoder(model):
+    return model.derived("encoder", lambda: FactorEncoder(model.vocabulary))
+
+
+#Parsed rows (csvParser.PrepareMovieData columns) for raw movies_metadata records (dicts, lists as
+#real lists or their literals). Records without an id are skipped; a repeated id keeps its last record.
+def prepare_movies(model, movies):
+    movies = list(movies)
+    if not movies:
+        return pd.DataFrame(columns=csvParser.RAW_COLUMNS + ['content'])
+    raw = pd.DataFrame(movies)
+    if 'id' in raw:
+        raw['id'] = [movie_key(i) if pd.notna(i) and i != '' else None for i in raw['id']]
+    data = csvParser.PrepareMovieData(raw)
+    data = data[data['id'] != ''].drop_duplicates('id', keep='last')
+    return data.reset_index(drop=True)
+
+
+#Catalog id -> row of every live row, carried forward from model to model by apply_delta
+def id_rows(model):
+    return model.derived("id_rows", lambda: {movie_key(i): row for row, i in enumerate(model.data.ids) if not model.deleted[row]})
+
+
+#The model with one delta applied (data is a Catalog of the new rows): tombstones the live rows of
+#deleted_ids, then appends the new rows to the catalog, factor matrix, similarity backend and title
+#index. Nothing is refitted or rescored.
+def apply_delta(model, sequence, data, movie_factors, deleted_ids):
+    rows = dict(id_rows(model))
+    deleted_rows = [rows.pop(key) for key in {movie_key(i) for i in deleted_ids} if key in rows]
+    start = len(model.data)
+    deleted = np.concatenate([model.deleted, np.zeros(len(data), dtype=bool)])
+    deleted[deleted_rows] = True
+
+    catalog, factors, engine = model.data, model.factors, model.engine
+    if len(data):
+        catalog = model.data.appended(data)
+        factors = sp.vstack([model.factors, movie_factors], format="csr")
+        engine = model.engine.appended(factors)
+        #The exact and IVF engines hold the (normalized) factor rows; share them as load_model does
+        if isinstance(engine, SimilarityEngine):
+            factors = engine.factors
+    titles = model.titles.appended(catalog, deleted_rows)
+
+    updated = Model(model.version, catalog, factors, engine, titles, model.vocabulary, model.manifest,
+                    revision=sequence, deleted=deleted)
+    rows.update({movie_key(i): row for row, i in enumerate(data.ids, start=start)})
+    updated.derived("id_rows", lambda: rows)
+    updated.derived("encoder", lambda: encoder(model))
+    updated.derived("title_search", lambda: title_search(model).appended(updated))
+    return updated